@@ -0,0 +1,183 @@
+"""Content-addressed backups of the config folders.
+
+Files are stored once under ``objects/`` by sha256; each backup run only
+writes a small JSON snapshot mapping paths to hashes, plus a line in
+``catalog.json`` so listing backups never has to open the snapshots.
+"""
+import json
+import os
+import stat
+from datetime import datetime
+
+from installer.sync import copy_atomic, file_hash, write_atomic
+
+DEFAULT_ROOT = os.path.expanduser("~/.config/backup")
+
+
+def display_path(path):
+    home = os.path.expanduser("~")
+    if path == home or path.startswith(home + os.sep):
+        return "~" + path[len(home):]
+    return path
+
+
+def walk_paths(paths):
+    for root in paths:
+        if os.path.islink(root) or os.path.isfile(root):
+            yield root
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                yield os.path.join(dirpath, name)
+
+
+class BackupStore:
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.snapshots = os.path.join(root, "snapshots")
+        self.catalog_path = os.path.join(root, "catalog.json")
+
+    def catalog(self):
+        try:
+            with open(self.catalog_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def load(self, snapshot_id):
+        if snapshot_id == "latest":
+            catalog = self.catalog()
+            if not catalog:
+                raise KeyError("No backups yet")
+            snapshot_id = catalog[-1]["id"]
+        try:
+            with open(os.path.join(self.snapshots, f"{snapshot_id}.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(f"No backup called {snapshot_id}") from None
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest[2:])
+
+    def _store_blob(self, path, digest):
+        blob = self.object_path(digest)
+        if os.path.exists(blob):
+            return 0
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        copy_atomic(path, blob)
+        return os.path.getsize(blob)
+
+    def scan(self, paths, previous=None):
+        """Describe the files under ``paths``, reusing hashes from ``previous``
+        for files whose size and mtime have not moved."""
+        known = (previous or {}).get("files", {})
+        files = {}
+        links = {}
+        for path in walk_paths(paths):
+            key = display_path(path)
+            st = os.lstat(path)
+            if stat.S_ISLNK(st.st_mode):
+                links[key] = os.readlink(path)
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            old = known.get(key)
+            if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                digest = old["sha256"]
+            else:
+                digest = file_hash(path)
+            files[key] = {
+                "sha256": digest,
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "mode": stat.S_IMODE(st.st_mode),
+            }
+        return {"files": files, "links": links}
+
+    def snapshot(self, paths):
+        """Back up ``paths`` and return the new catalog entry, or None when
+        nothing changed since the last backup."""
+        paths = [p for p in paths if os.path.lexists(p)]
+        catalog = self.catalog()
+        previous = self.load(catalog[-1]["id"]) if catalog else None
+        state = self.scan(paths, previous)
+        if previous and state["files"] == previous["files"] and state["links"] == previous["links"]:
+            return None
+
+        new_bytes = 0
+        for key, entry in state["files"].items():
+            new_bytes += self._store_blob(os.path.expanduser(key), entry["sha256"])
+
+        snapshot_id = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        while any(item["id"] == snapshot_id for item in catalog):
+            snapshot_id += "+"
+        snapshot = {
+            "id": snapshot_id,
+            "roots": [display_path(p) for p in paths],
+            **state,
+        }
+        write_atomic(os.path.join(self.snapshots, f"{snapshot_id}.json"), json.dumps(snapshot, indent=1))
+        entry = {
+            "id": snapshot_id,
+            "roots": snapshot["roots"],
+            "files": len(state["files"]),
+            "bytes": sum(f["size"] for f in state["files"].values()),
+            "new_bytes": new_bytes,
+        }
+        catalog.append(entry)
+        write_atomic(self.catalog_path, json.dumps(catalog, indent=1))
+        return entry
+
+    def diff(self, old_id, new_id=None):
+        """Compare two snapshots, or a snapshot against the live files."""
+        old = self.load(old_id)
+        new = self.load(new_id) if new_id else self.scan(
+            [os.path.expanduser(p) for p in old["roots"]], old)
+        old_files = {**old["files"], **old["links"]}
+        new_files = {**new["files"], **new["links"]}
+
+        def same(path):
+            a, b = old_files[path], new_files[path]
+            if isinstance(a, dict) and isinstance(b, dict):
+                return a["sha256"] == b["sha256"] and a["mode"] == b["mode"]
+            return a == b
+
+        return {
+            "added": sorted(set(new_files) - set(old_files)),
+            "removed": sorted(set(old_files) - set(new_files)),
+            "modified": sorted(p for p in set(old_files) & set(new_files) if not same(p)),
+        }
+
+    def restore(self, snapshot_id, prefixes=None):
+        """Write files from a snapshot back to where they came from. With
+        ``prefixes`` only paths starting with one of them are restored."""
+        snapshot = self.load(snapshot_id)
+        restored = []
+        prefixes = [display_path(os.path.abspath(os.path.expanduser(p))) for p in prefixes or []]
+
+        def wanted(key):
+            return not prefixes or any(key == p or key.startswith(p.rstrip("/") + "/") for p in prefixes)
+
+        for key, entry in snapshot["files"].items():
+            if not wanted(key):
+                continue
+            dest = os.path.expanduser(key)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if os.path.islink(dest):
+                os.unlink(dest)
+            copy_atomic(self.object_path(entry["sha256"]), dest)
+            os.chmod(dest, entry["mode"])
+            os.utime(dest, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+            restored.append(key)
+        for key, target in snapshot["links"].items():
+            if not wanted(key):
+                continue
+            dest = os.path.expanduser(key)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if os.path.lexists(dest):
+                os.unlink(dest)
+            os.symlink(target, dest)
+            restored.append(key)
+        return restored
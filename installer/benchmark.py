@@ -0,0 +1,147 @@
+"""Benchmark the installer itself against stub system tools.
+
+Each run gets a throwaway HOME (with ~/dots pointing at this checkout), an
+empty pacman database and a bin directory of stub sudo/pacman/yay/git/
+makepkg/systemctl/netbird executables that log their arguments. The
+package stubs also add an entry for every package they are asked to
+install to the sandbox's local database, so the installer's own checks
+pass, and sudo runs pacman through its stub. What is left is the
+installer's own overhead, measured once on a fresh HOME and once more on
+the now provisioned one. A run where the install fails raises instead of
+reporting timings for a partial install.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+LOGGING_STUB = """#!/bin/sh
+echo "$(basename "$0") $*" >> "$STUB_LOG"
+"""
+
+# Records a local database entry like pacman's for each name in $@ given
+# after an install operation (-S, -Sy, -U), or for the build directory with
+# makepkg -i
+REGISTER = """\
+register() {
+    mkdir -p "$PACMAN_DBPATH/local/$1-1-1"
+    printf '%%NAME%%\\n%s\\n\\n%%VERSION%%\\n1-1\\n' "$1" > "$PACMAN_DBPATH/local/$1-1-1/desc"
+}
+"""
+
+PACKAGE_STUB = LOGGING_STUB + REGISTER + """\
+install= skip=
+for arg; do
+    if [ -n "$skip" ]; then skip=; continue; fi
+    case "$arg" in
+        --config|--dbpath|--root|--cachedir) skip=1 ;;
+        -S|-Sy|-Syu|-U) install=1 ;;
+        -*) ;;
+        *) if [ -n "$install" ]; then register "$arg"; fi ;;
+    esac
+done
+"""
+
+MAKEPKG_STUB = LOGGING_STUB + REGISTER + """\
+case " $* " in
+    *" -si "*|*" -i "*|*" --install "*) register "$(basename "$PWD")" ;;
+esac
+"""
+
+SUDO_STUB = LOGGING_STUB + """\
+if [ "$1" = pacman ]; then
+    exec "$@"
+fi
+"""
+
+GIT_STUB = LOGGING_STUB + """\
+if [ "$1" = clone ]; then
+    for dest; do :; done
+    mkdir -p "$dest"
+    touch "$dest/HEAD"
+    printf '#!/bin/sh\\nexit 0\\n' > "$dest/setup.sh"
+    chmod +x "$dest/setup.sh"
+fi
+"""
+
+STUBS = {
+    "sudo": SUDO_STUB,
+    "pacman": PACKAGE_STUB,
+    "yay": PACKAGE_STUB,
+    "makepkg": MAKEPKG_STUB,
+    "systemctl": LOGGING_STUB,
+    "netbird": LOGGING_STUB,
+    "git": GIT_STUB,
+}
+
+
+def make_sandbox(root, repo):
+    home = os.path.join(root, "home")
+    bin_dir = os.path.join(root, "bin")
+    dbpath = os.path.join(root, "pacman")
+    for path in (home, bin_dir, os.path.join(dbpath, "local"), os.path.join(dbpath, "sync")):
+        os.makedirs(path)
+    os.symlink(os.path.abspath(repo), os.path.join(home, "dots"))
+    for name, body in STUBS.items():
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(body)
+        os.chmod(path, 0o755)
+    env = {
+        key: value for key, value in os.environ.items()
+        if not key.startswith("XDG_")
+    }
+    env.update({
+        "HOME": home,
+        "PATH": bin_dir + os.pathsep + env.get("PATH", ""),
+        "PACMAN_DBPATH": dbpath,
+        "STUB_LOG": os.path.join(root, "calls.log"),
+    })
+    return env
+
+
+def run_install(repo, env, jobs):
+    log = os.path.join(env["HOME"], ".local", "state", "dots", "timings.jsonl")
+    seen = 0
+    if os.path.exists(log):
+        with open(log) as f:
+            seen = sum(1 for _ in f)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.join(repo, "qtile.py"), "install", "--jobs", str(jobs)],
+                            env=env, cwd=env["HOME"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        tail = "\n".join(result.stdout.splitlines()[-20:])
+        raise RuntimeError(f"install exited with status {result.returncode}:\n{tail}")
+    with open(log) as f:
+        records = [json.loads(line) for line in f][seen:]
+    return wall, records
+
+
+def benchmark(repo, runs=5, jobs=4):
+    results = {"fresh": [], "rerun": []}
+    calls = Counter()
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory(prefix="dots-bench-") as root:
+            env = make_sandbox(root, repo)
+            results["fresh"].append(run_install(repo, env, jobs))
+            results["rerun"].append(run_install(repo, env, jobs))
+            with open(env["STUB_LOG"]) as f:
+                calls.update(line.split(" ", 1)[0] for line in f)
+
+    for kind, samples in results.items():
+        walls = [wall for wall, _ in samples]
+        print(f"{kind}: median {statistics.median(walls):.3f}s, "
+              f"min {min(walls):.3f}s, max {max(walls):.3f}s over {runs} runs")
+        steps = {}
+        for _, records in samples:
+            for record in records:
+                steps.setdefault(record["step"], []).append(record["wall"])
+        for step, walls in sorted(steps.items(), key=lambda item: -statistics.median(item[1])):
+            print(f"  {step:<28}{statistics.median(walls):>9.4f}s")
+    print("stub calls per run: " + ", ".join(
+        f"{name} {count / runs:g}" for name, count in calls.most_common()))
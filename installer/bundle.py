@@ -0,0 +1,194 @@
+"""Offline provisioning bundles.
+
+A bundle is a plain tar file holding a local pacman repository: every
+package the installer would fetch, with its dependencies, the AUR packages
+prebuilt by makepkg, the repo database made by repo-add, and a
+manifest.json. Installing from a bundle extracts it and runs pacman with a
+config whose only repository is that directory.
+
+AUR packages are resolved through their .SRCINFO files first. AUR-only
+dependencies are added to the build, and dependencies from the repos are
+added to the download, so everything the AUR packages need at run time is
+in the bundle. AUR packages are built dependencies first. Those another
+AUR package needs are installed right after they are built, because
+makepkg --syncdeps can only fetch from the repos.
+"""
+import glob
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+
+from installer import gitcache
+from installer.pacmandb import strip_depend
+
+REPO_NAME = "dots"
+
+PACMAN_CONF = """\
+[options]
+Architecture = auto
+HoldPkg = pacman glibc
+
+[{name}]
+SigLevel = Optional TrustAll
+Server = file://{path}
+"""
+
+
+def download_repo_packages(packages, repo_dir, pacman_conf="/etc/pacman.conf"):
+    # An empty database makes pacman treat nothing as installed, so -Sw
+    # fetches the full dependency closure and not just what this box lacks
+    dbpath = tempfile.mkdtemp(prefix="dots-bundle-db-")
+    try:
+        subprocess.run(['sudo', 'pacman', '-Syw', '--noconfirm', '--config', pacman_conf,
+                        '--dbpath', dbpath, '--cachedir', repo_dir] + list(packages), check=True)
+    finally:
+        subprocess.run(['sudo', 'rm', '-rf', dbpath])
+    subprocess.run(['sudo', 'chown', '-R', f"{os.getuid()}:{os.getgid()}", repo_dir], check=True)
+
+
+def aur_url(package):
+    return f"https://aur.archlinux.org/{package}.git"
+
+
+def read_srcinfo(build_dir):
+    """Package names, run-time and build-time dependencies from .SRCINFO."""
+    names, depends, makedepends = [], [], []
+    with open(os.path.join(build_dir, ".SRCINFO"), encoding="utf-8") as f:
+        for line in f:
+            key, sep, value = line.strip().partition(" = ")
+            if not sep:
+                continue
+            # depends_x86_64 and friends count like plain depends
+            key = key.split("_", 1)[0]
+            if key == "pkgname":
+                names.append(value)
+            elif key == "depends":
+                depends.append(strip_depend(value))
+            elif key in ("makedepends", "checkdepends"):
+                makedepends.append(strip_depend(value))
+    return names, list(dict.fromkeys(depends)), list(dict.fromkeys(makedepends))
+
+
+def resolve_aur(packages, workdir, in_repos, offline=False):
+    """Clone ``packages`` and every AUR package they depend on into ``workdir``.
+
+    ``in_repos(name)`` tells whether the repos satisfy a dependency. Returns
+    the package bases in build order, the set of bases that other AUR
+    packages depend on, and the repo packages they need at run time.
+    """
+    info = {}
+    provider = {}
+    pending = list(packages)
+    while pending:
+        package = pending.pop(0)
+        if package in info or package in provider:
+            continue
+        build_dir = os.path.join(workdir, package)
+        gitcache.clone(aur_url(package), build_dir, offline=offline)
+        if not os.path.exists(os.path.join(build_dir, ".SRCINFO")):
+            raise RuntimeError(f"{package} is neither in the repos nor in the AUR")
+        names, depends, makedepends = read_srcinfo(build_dir)
+        info[package] = (depends, makedepends)
+        for name in names + [package]:
+            provider.setdefault(name, package)
+        pending.extend(dep for dep in depends + makedepends if not in_repos(dep))
+
+    repo_depends = set()
+    needs = {}
+    for package, (depends, makedepends) in info.items():
+        repo_depends.update(dep for dep in depends if in_repos(dep))
+        needs[package] = {provider[dep] for dep in depends + makedepends
+                          if not in_repos(dep) and provider[dep] != package}
+
+    order = []
+    waiting = {package: set(deps) for package, deps in needs.items()}
+    while waiting:
+        ready = sorted(package for package, deps in waiting.items() if not deps)
+        if not ready:
+            raise RuntimeError(f"Dependency cycle between AUR packages: {', '.join(sorted(waiting))}")
+        for package in ready:
+            del waiting[package]
+            for deps in waiting.values():
+                deps.discard(package)
+        order.extend(ready)
+    depended_on = set().union(*needs.values()) if needs else set()
+    return order, depended_on, repo_depends
+
+
+def build_aur_packages(order, depended_on, workdir, repo_dir):
+    for package in order:
+        print(f"Building {package}...")
+        command = ['makepkg', '--syncdeps', '--noconfirm']
+        if package in depended_on:
+            # Later builds need it installed, --syncdeps cannot get it
+            command += ['--install', '--asdeps', '--needed']
+        env = dict(os.environ, PKGDEST=repo_dir)
+        subprocess.run(command, cwd=os.path.join(workdir, package), env=env, check=True)
+
+
+def package_files(repo_dir):
+    return sorted(
+        path for path in glob.glob(os.path.join(repo_dir, "*.pkg.tar*"))
+        if not path.endswith(".sig")
+    )
+
+
+def export_bundle(repo_packages, aur_packages, output, in_repos, pacman_conf="/etc/pacman.conf",
+                  offline=False):
+    """Write a bundle holding ``repo_packages`` and the built ``aur_packages``,
+    both with their dependencies, to ``output``; return the manifest.
+    ``in_repos(name)`` tells whether the repos satisfy a dependency."""
+    with tempfile.TemporaryDirectory(prefix="dots-bundle-") as workdir:
+        repo_dir = os.path.join(workdir, REPO_NAME)
+        aur_dir = os.path.join(workdir, "aur")
+        os.makedirs(repo_dir)
+        order, depended_on, repo_depends = [], set(), set()
+        if aur_packages:
+            print(f"Resolving dependencies of {len(aur_packages)} AUR packages...")
+            order, depended_on, repo_depends = resolve_aur(aur_packages, aur_dir, in_repos, offline)
+        download = list(dict.fromkeys(list(repo_packages) + sorted(repo_depends)))
+        if download:
+            print(f"Downloading {len(download)} repo packages with dependencies...")
+            download_repo_packages(download, repo_dir, pacman_conf)
+        if order:
+            build_aur_packages(order, depended_on, aur_dir, repo_dir)
+
+        files = package_files(repo_dir)
+        if not files:
+            raise RuntimeError("No packages were collected")
+        subprocess.run(['repo-add', '--quiet', os.path.join(repo_dir, f"{REPO_NAME}.db.tar.gz")] + files,
+                       check=True)
+        manifest = {
+            "repo": list(repo_packages),
+            "aur": order,
+            "files": [os.path.basename(path) for path in files],
+        }
+        with open(os.path.join(repo_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+
+        tmp = f"{output}.tmp"
+        # Packages are already compressed, so the bundle itself is not
+        with tarfile.open(tmp, "w") as archive:
+            archive.add(repo_dir, arcname=REPO_NAME)
+        os.replace(tmp, output)
+    return manifest
+
+
+def unpack_bundle(path, dest):
+    """Extract the bundle at ``path`` under ``dest`` and return a pacman.conf
+    that uses it as the only repository."""
+    repo_dir = os.path.join(dest, REPO_NAME)
+    shutil.rmtree(repo_dir, ignore_errors=True)
+    os.makedirs(dest, exist_ok=True)
+    with tarfile.open(path) as archive:
+        members = [m for m in archive.getmembers() if m.name == REPO_NAME or m.name.startswith(REPO_NAME + "/")]
+        archive.extractall(dest, members=members, filter="data")
+    if not os.path.exists(os.path.join(repo_dir, f"{REPO_NAME}.db")):
+        raise RuntimeError(f"{path} is not a dots bundle")
+    conf = os.path.join(dest, "pacman.conf")
+    with open(conf, "w", encoding="utf-8") as f:
+        f.write(PACMAN_CONF.format(name=REPO_NAME, path=os.path.abspath(repo_dir)))
+    return conf
@@ -0,0 +1,148 @@
+"""Run installer steps on a thread pool in dependency order.
+
+Each step names the steps it needs. Steps whose dependencies are done run
+side by side; steps marked ``pacman=True`` additionally take PACMAN_LOCK so
+only one pacman/yay/makepkg transaction holds the database at a time.
+
+Steps with an ``inputs`` function are skipped when the fingerprint of those
+inputs matches the one stored in the StepState after their last successful
+run.
+"""
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from installer import timing
+from installer.state import fingerprint
+
+PACMAN_LOCK = threading.Lock()
+
+
+class Step:
+    def __init__(self, name, func, needs=(), pacman=False, inputs=None, changes=None):
+        self.name = name
+        self.func = func
+        self.needs = list(needs)
+        self.pacman = pacman
+        self.inputs = inputs
+        # Side-effect free preview of what func would do, for --plan
+        self.changes = changes
+
+    def __repr__(self):
+        return f"Step({self.name!r})"
+
+    def fingerprint(self):
+        if self.inputs is None:
+            return None
+        return fingerprint(self.inputs())
+
+    def run(self, state=None, force=False, recorder=None):
+        if recorder is None:
+            return self._locked_run(state, force)
+        with recorder.measure(self.name) as record:
+            record["status"] = self._locked_run(state, force)
+            return record["status"]
+
+    def _locked_run(self, state, force):
+        if not self.pacman:
+            return self._run(state, force)
+        waited = time.perf_counter()
+        with PACMAN_LOCK:
+            timing.add("lock_wait", round(time.perf_counter() - waited, 4))
+            return self._run(state, force)
+
+    def _run(self, state, force):
+        if state is None:
+            self.func()
+            return "done"
+        if not force and self.inputs is not None and state.is_current(self.name, self.fingerprint()):
+            print(f"{self.name} is up to date. Skipping...")
+            return "cached"
+        self.func()
+        state.record(self.name, "done", self.fingerprint())
+        return "done"
+
+
+def check_graph(steps):
+    names = {step.name for step in steps}
+    if len(names) != len(steps):
+        raise ValueError("Duplicate step names")
+    for step in steps:
+        for need in step.needs:
+            if need not in names:
+                raise ValueError(f"Step {step.name} needs unknown step {need}")
+    # Kahn's algorithm; anything left over sits on a cycle
+    order = topological_order(steps)
+    if len(order) != len(steps):
+        stuck = sorted(names - {step.name for step in order})
+        raise ValueError(f"Dependency cycle between: {', '.join(stuck)}")
+    return order
+
+
+def topological_order(steps):
+    # Stable: ties keep the order the steps were declared in
+    pending = {step.name: set(step.needs) for step in steps}
+    order = []
+    while True:
+        ready = [step for step in steps if step.name in pending and not pending[step.name]]
+        if not ready:
+            return order
+        for step in ready:
+            del pending[step.name]
+            for needs in pending.values():
+                needs.discard(step.name)
+        order.extend(ready)
+
+
+def run_steps(steps, workers=4, state=None, force=(), recorder=None):
+    """Run ``steps`` and return a dict of name -> "done", "cached", "failed"
+    or "skipped".
+
+    A step that raises is reported and everything depending on it is skipped;
+    unrelated branches keep going. Names in ``force`` run even when cached.
+    With a timing ``recorder`` every step that starts is measured.
+    """
+    order = check_graph(steps)
+    unknown = set(force) - {step.name for step in order}
+    if unknown:
+        raise ValueError(f"Unknown step: {', '.join(sorted(unknown))}")
+    status = {}
+    waiting = {step.name: set(step.needs) for step in order}
+    by_name = {step.name: step for step in order}
+    running = {}
+
+    def settle(name, result):
+        status[name] = result
+        for other, needs in list(waiting.items()):
+            # Skipped already through another step it needs
+            if other not in waiting or name not in needs:
+                continue
+            if result not in ("done", "cached"):
+                del waiting[other]
+                print(f"Skipping {other}: {name} did not finish")
+                settle(other, "skipped")
+            else:
+                needs.discard(name)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while waiting or running:
+            for name in [n for n in list(waiting) if not waiting[n]]:
+                del waiting[name]
+                running[pool.submit(by_name[name].run, state, name in force, recorder)] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except Exception:
+                    print(f"Step {name} failed:")
+                    traceback.print_exc()
+                    if state is not None:
+                        state.record(name, "failed")
+                    settle(name, "failed")
+                else:
+                    settle(name, future.result())
+    return status
@@ -0,0 +1,165 @@
+"""Generation based deploys of the config folders.
+
+Every deploy builds a read-only generation directory holding all managed
+folders. Files that did not change since the previous generation are
+hardlinked instead of copied. ``~/.config/<name>`` are symlinks to
+``<root>/current/<name>``, and ``current`` is itself a symlink to one
+generation, so switching or rolling back every folder at once is a single
+rename of ``current``.
+"""
+import json
+import os
+import shutil
+import stat
+import time
+
+from installer import STATE_HOME
+from installer.sync import file_hash, walk_files
+
+DEFAULT_ROOT = os.path.join(STATE_HOME, "dots", "generations")
+META = ".dots-generation.json"
+
+
+class Generations:
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self.current_link = os.path.join(root, "current")
+
+    def path(self, number):
+        return os.path.join(self.root, f"gen-{number}")
+
+    def numbers(self):
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[4:]) for name in names if name.startswith("gen-") and name[4:].isdigit())
+
+    def current(self):
+        try:
+            target = os.readlink(self.current_link)
+        except OSError:
+            return None
+        return int(os.path.basename(target)[4:])
+
+    def meta(self, number):
+        try:
+            with open(os.path.join(self.path(number), META), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _scan(self, sources):
+        files = {}
+        for name, src in sorted(sources.items()):
+            for rel, path in walk_files(src):
+                files[f"{name}/{rel}"] = (path, file_hash(path))
+        return files
+
+    def changes(self, sources):
+        """List the files a build from ``sources`` would change, compared
+        with the current generation."""
+        current = self.current()
+        if current is None:
+            # Nothing to compare with, so no need to read the files
+            return [f"copy {name}/{rel}" for name, src in sorted(sources.items()) for rel, _ in walk_files(src)]
+        digests = {rel: digest for rel, (_, digest) in self._scan(sources).items()}
+        old = self.meta(current).get("files", {})
+        changed = [f"update {rel}" for rel, digest in digests.items() if old.get(rel) != digest]
+        return changed + [f"remove {rel}" for rel in sorted(set(old) - set(digests))]
+
+    def build(self, sources, executables=()):
+        """Build a generation from ``sources`` ({name: source dir}) and return
+        its number. Reuses the current generation if nothing changed."""
+        files = self._scan(sources)
+        digests = {rel: digest for rel, (_, digest) in files.items()}
+
+        current = self.current()
+        previous = self.path(current) if current is not None else None
+        if previous and self.meta(current).get("files") == digests:
+            return current
+
+        numbers = self.numbers()
+        number = (numbers[-1] + 1) if numbers else 1
+        final = self.path(number)
+        tmp = f"{final}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        old_digests = self.meta(current).get("files", {}) if previous else {}
+        for rel, (src, digest) in files.items():
+            dest = os.path.join(tmp, rel)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if old_digests.get(rel) == digest:
+                os.link(os.path.join(previous, rel), dest)
+                continue
+            shutil.copy2(src, dest)
+            mode = 0o555 if rel in executables else 0o444
+            os.chmod(dest, mode)
+        with open(os.path.join(tmp, META), "w", encoding="utf-8") as f:
+            json.dump({"time": time.time(), "names": sorted(sources), "files": digests}, f, indent=1)
+        for name in sources:
+            os.makedirs(os.path.join(tmp, name), exist_ok=True)
+        _set_tree_writable(tmp, False)
+        os.rename(tmp, final)
+        return number
+
+    def switch(self, number):
+        """Point ``current`` at generation ``number`` with one atomic rename."""
+        if not os.path.isdir(self.path(number)):
+            raise KeyError(f"No generation {number}")
+        tmp = os.path.join(self.root, f".current.{os.getpid()}")
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        os.symlink(os.path.basename(self.path(number)), tmp)
+        os.replace(tmp, self.current_link)
+
+    def link(self, name, dest):
+        """Make ``dest`` a symlink into the current generation. A real
+        directory already there is moved under ``<root>/replaced``."""
+        target = os.path.join(self.current_link, name)
+        if os.path.islink(dest) and os.readlink(dest) == target:
+            return False
+        if os.path.lexists(dest) and not os.path.islink(dest):
+            aside = os.path.join(self.root, "replaced", f"{name}-{time.strftime('%Y-%m-%d_%H-%M-%S')}")
+            os.makedirs(os.path.dirname(aside), exist_ok=True)
+            os.rename(dest, aside)
+            print(f"Moved {dest} to {aside}")
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.dots-link"
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        os.symlink(target, tmp)
+        os.replace(tmp, dest)
+        return True
+
+    def is_managed(self, dest):
+        return os.path.islink(dest) and os.readlink(dest).startswith(self.current_link + os.sep)
+
+    def deploy(self, folders, executables=()):
+        """Build and switch to a generation for ``folders`` ({name: (src, dest)})."""
+        number = self.build({name: src for name, (src, _) in folders.items()}, executables)
+        changed = number != self.current()
+        if changed:
+            self.switch(number)
+        for name, (_, dest) in folders.items():
+            self.link(name, dest)
+        return number, changed
+
+    def collect_garbage(self, keep=5):
+        """Delete all but the newest ``keep`` generations, never the current one."""
+        current = self.current()
+        removed = []
+        for number in self.numbers()[:-keep] if keep else self.numbers():
+            if number == current:
+                continue
+            path = self.path(number)
+            _set_tree_writable(path, True)
+            shutil.rmtree(path)
+            removed.append(number)
+        return removed
+
+
+def _set_tree_writable(root, writable):
+    # Directories only: files are created read-only and hardlinks share them
+    for dirpath, _, _ in os.walk(root):
+        mode = stat.S_IMODE(os.stat(dirpath).st_mode)
+        os.chmod(dirpath, mode | 0o200 if writable else mode & ~0o222)
@@ -0,0 +1,84 @@
+"""Shared bare mirrors for the repositories the installer clones.
+
+Each remote is mirrored once under ``~/.cache/dots/git``. Working copies are
+cloned from the mirror, which git does with hardlinks, and the mirror is
+only fetched again once it is older than the TTL. In offline mode whatever
+is already cached is used as is.
+"""
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+CACHE_HOME = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+CACHE_DIR = os.path.join(CACHE_HOME, "dots", "git")
+DEFAULT_TTL = int(os.environ.get("DOTS_GIT_TTL", 6 * 60 * 60))
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+class MirrorError(Exception):
+    pass
+
+
+def mirror_path(url, cache_dir=None):
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", url.rstrip("/").rsplit("/", 1)[-1])
+    if not name.endswith(".git"):
+        name += ".git"
+    digest = hashlib.sha1(url.encode()).hexdigest()[:10]
+    return os.path.join(cache_dir or CACHE_DIR, f"{digest}-{name}")
+
+
+def _lock(path):
+    with _locks_lock:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def _age(path):
+    # git touches FETCH_HEAD on every fetch; a fresh mirror only has HEAD
+    for name in ("FETCH_HEAD", "HEAD"):
+        try:
+            return time.time() - os.path.getmtime(os.path.join(path, name))
+        except OSError:
+            continue
+    return None
+
+
+def update_mirror(url, ttl=DEFAULT_TTL, offline=False, cache_dir=None):
+    """Make sure a mirror of ``url`` exists and is fresh enough; return its path."""
+    path = mirror_path(url, cache_dir)
+    with _lock(path):
+        age = _age(path)
+        if age is None:
+            if offline:
+                raise MirrorError(f"{url} is not cached and offline mode is on")
+            print(f"Mirroring {url}...")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            result = subprocess.run(["git", "clone", "--mirror", "--quiet", url, tmp])
+            if result.returncode != 0:
+                raise MirrorError(f"Could not mirror {url}")
+            os.replace(tmp, path)
+        elif age > ttl and not offline:
+            print(f"Refreshing mirror of {url}...")
+            result = subprocess.run(["git", "-C", path, "fetch", "--prune", "--quiet", "origin"])
+            if result.returncode != 0:
+                print(f"Could not refresh {url}, using the cached copy")
+    return path
+
+
+def clone(url, dest, ttl=DEFAULT_TTL, offline=False, cache_dir=None):
+    """Clone ``url`` into ``dest`` from the local mirror.
+
+    The clone's origin points back at ``url`` so it behaves like a normal
+    clone afterwards.
+    """
+    path = update_mirror(url, ttl, offline, cache_dir)
+    subprocess.run(["git", "clone", "--quiet", path, dest], check=True)
+    subprocess.run(["git", "-C", dest, "remote", "set-url", "origin", url], check=True)
+    return dest
@@ -0,0 +1,198 @@
+"""Read-only index of the pacman databases.
+
+Parses ``local/*/desc`` and the ``sync/*.db`` tarballs once and answers
+installed/version/optdepends questions from memory, so installer steps don't
+have to spawn pacman and scrape its output.
+"""
+import os
+import tarfile
+import threading
+
+DEFAULT_DBPATH = "/var/lib/pacman"
+
+
+def parse_desc(text):
+    fields = {}
+    key = None
+    for line in text.splitlines():
+        if line.startswith("%") and line.endswith("%") and len(line) > 2:
+            key = line[1:-1]
+            fields[key] = []
+        elif line and key is not None:
+            fields[key].append(line)
+    return fields
+
+
+def strip_depend(entry):
+    # "foo>=1.2: some description" -> "foo"
+    name = entry.split(":", 1)[0].strip()
+    for op in ("<", ">", "="):
+        name = name.split(op, 1)[0]
+    return name
+
+
+def _package(fields, repo=None):
+    return {
+        "name": fields.get("NAME", [""])[0],
+        "version": fields.get("VERSION", [""])[0],
+        "repo": repo,
+        "groups": fields.get("GROUPS", []),
+        "provides": [strip_depend(p) for p in fields.get("PROVIDES", [])],
+        "depends": [strip_depend(d) for d in fields.get("DEPENDS", [])],
+        "optdepends": [strip_depend(d) for d in fields.get("OPTDEPENDS", [])],
+    }
+
+
+class PackageDB:
+    def __init__(self, dbpath=DEFAULT_DBPATH):
+        self.dbpath = dbpath
+        # Installer steps share one index across threads
+        self._lock = threading.RLock()
+        self._local = None
+        self._provided = None
+        self._sync = None
+        self._sync_provided = None
+        self._groups = None
+
+    def invalidate(self):
+        # Call after anything that runs a pacman transaction or -Sy
+        with self._lock:
+            self._local = None
+            self._provided = None
+            self._sync = None
+            self._sync_provided = None
+            self._groups = None
+
+    def _load_local(self):
+        local = {}
+        provided = {}
+        local_dir = os.path.join(self.dbpath, "local")
+        try:
+            entries = list(os.scandir(local_dir))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            try:
+                with open(os.path.join(entry.path, "desc"), encoding="utf-8") as f:
+                    package = _package(parse_desc(f.read()))
+            except OSError:
+                continue
+            local[package["name"]] = package
+            for name in package["provides"]:
+                provided.setdefault(name, package["name"])
+        self._provided = provided
+        self._local = local
+
+    def _load_sync(self):
+        sync = {}
+        provided = {}
+        groups = {}
+        sync_dir = os.path.join(self.dbpath, "sync")
+        try:
+            names = sorted(os.listdir(sync_dir))
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if not name.endswith(".db"):
+                continue
+            repo = name[:-3]
+            try:
+                archive = tarfile.open(os.path.join(sync_dir, name), "r:*")
+            except (tarfile.ReadError, OSError) as e:
+                print(f"Cannot read sync database {name}: {e}")
+                continue
+            with archive:
+                for member in archive:
+                    if not member.isfile() or not member.name.endswith("/desc"):
+                        continue
+                    data = archive.extractfile(member).read().decode("utf-8", "replace")
+                    package = _package(parse_desc(data), repo)
+                    # Same name in two repos: keep the first one read
+                    if package["name"] in sync:
+                        continue
+                    sync[package["name"]] = package
+                    for name in package["provides"]:
+                        provided.setdefault(name, package["name"])
+                    for group in package["groups"]:
+                        groups.setdefault(group, []).append(package["name"])
+        self._groups = groups
+        self._sync_provided = provided
+        self._sync = sync
+
+    @property
+    def local(self):
+        with self._lock:
+            if self._local is None:
+                self._load_local()
+            return self._local
+
+    @property
+    def provided(self):
+        with self._lock:
+            if self._local is None:
+                self._load_local()
+            return self._provided
+
+    @property
+    def sync(self):
+        with self._lock:
+            if self._sync is None:
+                self._load_sync()
+            return self._sync
+
+    @property
+    def sync_provided(self):
+        with self._lock:
+            if self._sync is None:
+                self._load_sync()
+            return self._sync_provided
+
+    @property
+    def groups(self):
+        with self._lock:
+            if self._sync is None:
+                self._load_sync()
+            return self._groups
+
+    def stamp(self):
+        """Fingerprint of both databases from directory listings and stats only.
+
+        Changes when a package is installed, removed or upgraded, or when -Sy
+        fetches new sync databases, without parsing either.
+        """
+        try:
+            local = sorted(os.listdir(os.path.join(self.dbpath, "local")))
+        except FileNotFoundError:
+            local = []
+        sync = []
+        sync_dir = os.path.join(self.dbpath, "sync")
+        try:
+            names = sorted(os.listdir(sync_dir))
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if name.endswith(".db"):
+                st = os.stat(os.path.join(sync_dir, name))
+                sync.append([name, st.st_size, st.st_mtime_ns])
+        return {"local": local, "sync": sync}
+
+    def is_installed(self, name):
+        return name in self.local or name in self.provided
+
+    def version(self, name):
+        package = self.local.get(name)
+        return package["version"] if package else None
+
+    def in_repos(self, name):
+        return name in self.sync
+
+    def satisfiable_from_repos(self, name):
+        # A dependency can also be met by a repo package that provides it
+        return name in self.sync or name in self.sync_provided
+
+    def optdepends(self, name):
+        # Prefer the repo metadata, it is what -S would install
+        package = self.sync.get(name) or self.local.get(name)
+        return list(package["optdepends"]) if package else []
@@ -0,0 +1,48 @@
+"""Persistent record of which installer steps finished, and with what inputs.
+
+A step's fingerprint is a hash of whatever its inputs function returns
+(package lists, source file hashes, relevant bits of system state). The
+fingerprint is taken right after the step succeeds, so on the next run an
+unchanged fingerprint means the step has nothing left to do.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from installer import STATE_HOME
+from installer.sync import write_atomic
+
+DEFAULT_PATH = os.path.join(STATE_HOME, "dots", "steps.json")
+
+
+def fingerprint(inputs):
+    data = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class StepState:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.steps = json.load(f)
+        except (OSError, ValueError):
+            self.steps = {}
+
+    def is_current(self, name, digest):
+        entry = self.steps.get(name)
+        return bool(entry) and entry["status"] == "done" and entry["fingerprint"] == digest
+
+    def record(self, name, status, digest=None):
+        with self.lock:
+            self.steps[name] = {"status": status, "fingerprint": digest, "time": time.time()}
+            write_atomic(self.path, json.dumps(self.steps, indent=1, sort_keys=True))
+
+    def forget(self, names):
+        with self.lock:
+            for name in names:
+                self.steps.pop(name, None)
+            write_atomic(self.path, json.dumps(self.steps, indent=1, sort_keys=True))
@@ -0,0 +1,161 @@
+"""Incremental one-way sync of a source tree into a destination tree.
+
+A JSON manifest per destination remembers the size, mtime and sha256 of
+every file that was synced. Files whose source and destination stats still
+match the manifest are skipped without being read, changed files are
+written through a temporary file and renamed into place, and files that
+disappeared from the source are removed from the destination.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from installer import STATE_HOME, timing
+
+MANIFEST_DIR = os.path.join(STATE_HOME, "dots", "manifests")
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def manifest_path(dest, manifest_dir=None):
+    name = hashlib.sha1(os.path.abspath(dest).encode()).hexdigest()[:16]
+    return os.path.join(manifest_dir or MANIFEST_DIR, f"{name}.json")
+
+
+def load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+
+def write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def copy_atomic(src, dest):
+    # Copy next to the destination, then rename over it, so a reader never
+    # sees a half-written file
+    directory = os.path.dirname(dest)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(dest)}.")
+    try:
+        with open(src, "rb") as fsrc, os.fdopen(fd, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dest)
+        timing.add("bytes", os.path.getsize(dest))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def walk_files(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            yield os.path.relpath(path, root), path
+
+
+def _stat_key(st):
+    return [st.st_size, st.st_mtime_ns]
+
+
+def sync_tree(src, dest, manifest_dir=None, dry_run=False):
+    """Make ``dest`` mirror ``src`` and return counts of what happened.
+
+    Only files listed in the manifest are ever deleted, so anything the user
+    created in ``dest`` themselves is left alone. With ``dry_run`` nothing is
+    written and the returned lists say what would change. ``new`` lists the
+    copied files that did not exist in ``dest``; a dry run does not read them.
+    """
+    if not os.path.isdir(src):
+        raise FileNotFoundError(src)
+    path = manifest_path(dest, manifest_dir)
+    old = load_manifest(path)["files"]
+    new = {}
+    result = {"copied": [], "new": [], "unchanged": 0, "removed": [], "bytes": 0}
+
+    for rel, src_file in walk_files(src):
+        dest_file = os.path.join(dest, rel)
+        src_stat = os.stat(src_file)
+        try:
+            dest_stat = os.stat(dest_file)
+        except FileNotFoundError:
+            dest_stat = None
+        entry = old.get(rel)
+
+        if (entry and dest_stat
+                and entry["src"] == _stat_key(src_stat)
+                and entry["dest"] == _stat_key(dest_stat)):
+            new[rel] = entry
+            result["unchanged"] += 1
+            continue
+
+        # A missing or differently sized destination is copied either way,
+        # so the source is only read here when the sizes match
+        digest = None
+        if dest_stat and dest_stat.st_size == src_stat.st_size:
+            # Stats moved but content may not have (touch, checkout, or a
+            # destination that predates the manifest)
+            digest = file_hash(src_file)
+            known = entry["sha256"] if entry and entry["dest"] == _stat_key(dest_stat) else None
+            if (known or file_hash(dest_file)) == digest:
+                new[rel] = {"src": _stat_key(src_stat), "dest": _stat_key(dest_stat), "sha256": digest}
+                result["unchanged"] += 1
+                continue
+
+        result["copied"].append(rel)
+        if dest_stat is None:
+            result["new"].append(rel)
+        result["bytes"] += src_stat.st_size
+        if dry_run:
+            continue
+        os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+        copy_atomic(src_file, dest_file)
+        new[rel] = {"src": _stat_key(src_stat), "dest": _stat_key(os.stat(dest_file)),
+                    "sha256": digest or file_hash(dest_file)}
+
+    for rel in sorted(set(old) - set(new)):
+        if os.path.exists(os.path.join(src, rel)):
+            continue
+        result["removed"].append(rel)
+        if dry_run:
+            continue
+        dest_file = os.path.join(dest, rel)
+        try:
+            os.unlink(dest_file)
+        except FileNotFoundError:
+            pass
+        # Drop directories the removal left empty, up to the sync root
+        parent = os.path.dirname(dest_file)
+        while os.path.abspath(parent) != os.path.abspath(dest):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+    if not dry_run:
+        write_atomic(path, json.dumps({"src": os.path.abspath(src), "files": new}, indent=1))
+    return result
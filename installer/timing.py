@@ -0,0 +1,103 @@
+"""Per-step timing for installer runs.
+
+Recorder.measure() wraps one step and records wall time, the step thread's
+CPU time, CPU time of child processes, how many subprocesses it started and
+how many bytes it copied. Every record is appended to a JSON-lines log and
+a summary table is printed at the end of the run.
+
+Child CPU comes from RUSAGE_CHILDREN, which is process wide: when steps run
+in parallel, children of overlapping steps are counted in each of them. Use
+``--jobs 1`` when exact attribution matters.
+"""
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from installer import STATE_HOME
+
+DEFAULT_LOG = os.path.join(STATE_HOME, "dots", "timings.jsonl")
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+class _CountingPopen(subprocess.Popen):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        add("subprocesses", 1)
+
+
+def instrument_subprocess():
+    # subprocess.run() looks Popen up on the module at call time, so this
+    # also counts every subprocess.run() call made by a step
+    if subprocess.Popen is not _CountingPopen:
+        subprocess.Popen = _CountingPopen
+
+
+def add(key, amount):
+    """Add to a counter of the step running on this thread, if any."""
+    counters = getattr(_local, "counters", None)
+    if counters is not None:
+        counters[key] = counters.get(key, 0) + amount
+
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Recorder:
+    def __init__(self, log_path=DEFAULT_LOG):
+        self.log_path = log_path
+        self.run_id = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.started = time.perf_counter()
+        self.records = []
+        instrument_subprocess()
+
+    @contextmanager
+    def measure(self, name):
+        record = {"run": self.run_id, "step": name, "status": "done"}
+        _local.counters = {"subprocesses": 0, "bytes": 0}
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        children = _children_cpu()
+        try:
+            yield record
+        except BaseException:
+            record["status"] = "failed"
+            raise
+        finally:
+            record["start"] = round(wall - self.started, 4)
+            record["wall"] = round(time.perf_counter() - wall, 4)
+            record["cpu"] = round(time.thread_time() - cpu, 4)
+            record["child_cpu"] = round(_children_cpu() - children, 4)
+            record.update(_local.counters)
+            _local.counters = None
+            self._write(record)
+
+    def _write(self, record):
+        with _log_lock:
+            self.records.append(record)
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def print_summary(self):
+        total = time.perf_counter() - self.started
+        print(format_table(self.records))
+        print(f"Total: {total:.2f}s wall, "
+              f"{sum(r['subprocesses'] for r in self.records)} subprocesses, "
+              f"{sum(r['bytes'] for r in self.records)} bytes copied")
+
+
+def format_table(records):
+    header = f"{'step':<28}{'status':<9}{'wall':>9}{'cpu':>9}{'child':>9}{'procs':>7}{'bytes':>12}"
+    lines = [header, "-" * len(header)]
+    for r in sorted(records, key=lambda r: r["wall"], reverse=True):
+        lines.append(f"{r['step']:<28}{r['status']:<9}{r['wall']:>9.3f}{r['cpu']:>9.3f}"
+                     f"{r['child_cpu']:>9.3f}{r['subprocesses']:>7}{r['bytes']:>12}")
+    return "\n".join(lines)
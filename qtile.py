@@ -1,43 +1,69 @@
+import argparse
+import getpass
+import glob
+import grp
 import os
 import shutil
 import subprocess
-from datetime import datetime
+import sys
+import tempfile
+import time
+from functools import partial
+
+from installer import benchmark, bundle, gitcache, timing
+from installer.backup import BackupStore
+from installer.dag import Step, check_graph, run_steps
+from installer.generations import Generations
+from installer.pacmandb import DEFAULT_DBPATH, PackageDB
+from installer.state import StepState
+from installer.sync import file_hash, sync_tree, walk_files
+
+PACMAN_DB = PackageDB(os.environ.get("PACMAN_DBPATH", DEFAULT_DBPATH))
+
+# Set by --offline: clone only from the local git mirrors
+OFFLINE = False
+
+# Set by --from-bundle: pacman.conf whose only repository is the unpacked bundle
+PACMAN_CONF = None
+
+
+def pacman_command(*args):
+    command = ['sudo', 'pacman']
+    if PACMAN_CONF:
+        command += ['--config', PACMAN_CONF]
+    return command + list(args)
+
+BACKUP_PATHS = [
+    "~/.config/.bashrc",
+    "~/.config/qtile",
+    "~/.config/dunst",
+    "~/.config/picom",
+    "~/.config/rofi",
+    "~/.config/alacritty",
+    "~/.config/nano"
+]
+
+BACKUP_STORE = BackupStore(os.path.expanduser("~/.config/backup"))
 
-import subprocess
 
 def backup_config():
     print("Backing up qtile, dunst, and picom folders...")
-    config_path = os.path.expanduser("~/.config")
-    backup_folder = os.path.join(config_path, "backup")
-    timestamp = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
-    backup_path = os.path.join(backup_folder, f"backup_{timestamp}")
-    folders_to_backup = [
-        os.path.expanduser("~/.config/.bashrc"),
-        os.path.expanduser("~/.config/qtile"),
-        os.path.expanduser("~/.config/dunst"),
-        os.path.expanduser("~/.config/picom"),
-        os.path.expanduser("~/.config/rofi"),
-        os.path.expanduser("~/.config/alacritty"),
-        os.path.expanduser("~/.config/nano")
-
-    ]
     try:
-        os.makedirs(backup_path, exist_ok=True)
-        for folder in folders_to_backup:
-            if os.path.exists(folder):
-                shutil.move(folder, backup_path)
-                print(f"Moved folder: {folder} to {backup_path}")
-            else:
-                print(f"Folder {folder} does not exist. Skipping backup...")
-    except shutil.Error as e:
-        print(f"Error moving directory: {e}")
+        entry = BACKUP_STORE.snapshot([os.path.expanduser(p) for p in BACKUP_PATHS])
+    except OSError as e:
+        print(f"Error backing up config: {e}")
+        raise
+    if entry is None:
+        print("Nothing changed since the last backup. Skipping...")
+    else:
+        print(f"Backup {entry['id']}: {entry['files']} files, {entry['new_bytes']} new bytes stored")
 
 
 def install_incus():
-    installed = subprocess.run(['sudo', 'pacman', '-Q', 'incus'], capture_output=True)
-    if installed.returncode != 0:
+    if not PACMAN_DB.is_installed('incus'):
         print("Incus is not installed. Installing...")
-        subprocess.run(['sudo', 'pacman', '-S', '--needed', 'incus'])
+        subprocess.run(pacman_command('-S', '--needed', 'incus'), check=True)
+        PACMAN_DB.invalidate()
 
 
 def overwrite_pacman_conf():
@@ -51,84 +77,135 @@ def overwrite_pacman_conf():
         print(f"File {destination_file} overwritten successfully with sudo.")
     except subprocess.CalledProcessError as e:
         print(f"Error overwriting file: {e}")
+        raise
         
 
+PACKAGES = [
+    "git", "xorg", "xorg-xinit", "picom", "alacritty", "gtk3", "arc-gtk-theme", "swtpm",
+    "dunst", "neofetch", "qemu-full", "virt-manager", "rofi", "pavucontrol", "pipewire-alsa",
+    "pipewire-pulse", "virt-viewer", "dnsmasq", "bridge-utils", "libguestfs", "ebtables", "vde2",
+    "openbsd-netcat","openssh", "feh", "mc", "alsa-utils", "python-pywal", "docker", "tigervnc",
+    "docker-compose", "thunar", "nerd-fonts", "nano", "nano-syntax-highlighting", "udiskie", "freerdp2"
+]
+
+OPTIONAL_PACKAGES = [
+    "vscodium-bin", "udisks2", "gvfs", "vscodium-bin", "netbird-bin", "ffmpegthumbnailer", 
+    "unarchiver", "jq", "poppler", "fd", "ripgrep", "fzf", "pipewire-module-xrdp-git",
+    "zoxide", "brave-bin", "python-psutil", "python-pulsectl-asyncio", "qtile-extras"
+]
+
+
+# Installed by their own steps rather than from the lists above
+EXTRA_PACKAGES = ["incus", "openssh", "wine", "wine-mono", "wine-gecko", "yay"]
+
+
+def expand_groups(packages):
+    # Groups like xorg are expanded to their members so each one can be checked
+    wanted = []
+    for package in dict.fromkeys(packages):
+        if package in PACMAN_DB.groups and not PACMAN_DB.in_repos(package):
+            wanted.extend(PACMAN_DB.groups[package])
+        else:
+            wanted.append(package)
+    return list(dict.fromkeys(wanted))
+
+
+def plan_packages(packages):
+    wanted = expand_groups(packages)
+    missing = [package for package in wanted if not PACMAN_DB.is_installed(package)]
+    return {
+        "installed": [package for package in wanted if package not in missing],
+        "repo": [package for package in missing if PACMAN_DB.in_repos(package)],
+        "aur": [package for package in missing if not PACMAN_DB.in_repos(package)],
+    }
+
+
+def print_package_plan(plan):
+    print(f"  already installed: {len(plan['installed'])}")
+    print(f"  from repos ({len(plan['repo'])}): {' '.join(plan['repo']) or '-'}")
+    print(f"  from AUR ({len(plan['aur'])}): {' '.join(plan['aur']) or '-'}")
+
+
+def install_package_plan(plan):
+    if plan['repo']:
+        print(f"Installing {len(plan['repo'])} repo packages in one transaction...")
+        subprocess.run(pacman_command('-S', '--needed', '--noconfirm', *plan['repo']), check=True)
+        PACMAN_DB.invalidate()
+    if plan['aur']:
+        if shutil.which('yay') is None:
+            # Raising keeps the step from being recorded as done, so the next run retries it
+            raise RuntimeError(f"yay not found, cannot install AUR packages: {' '.join(plan['aur'])}")
+        print(f"Installing {len(plan['aur'])} AUR packages in one transaction...")
+        subprocess.run(['yay', '-S', '--needed', '--noconfirm'] + plan['aur'], check=True)
+        PACMAN_DB.invalidate()
+
+
+def install_packages(packages):
+    plan = plan_packages(packages)
+    print_package_plan(plan)
+    install_package_plan(plan)
+    # An install can exit 0 and still leave packages out
+    still_missing = plan_packages(packages)
+    missing = still_missing['repo'] + still_missing['aur']
+    if missing:
+        raise RuntimeError(f"Packages still not installed: {' '.join(missing)}")
+
+
 def check_packages():
     print("Checking and installing necessary packages...")
-    packages = [
-        "git", "xorg", "xorg-xinit", "picom", "alacritty", "gtk3", "arc-gtk-theme", "swtpm",
-        "dunst", "neofetch", "qemu-full", "virt-manager", "rofi", "pavucontrol", "pipewire-alsa",
-        "pipewire-pulse", "virt-viewer", "dnsmasq", "bridge-utils", "libguestfs", "ebtables", "vde2",
-        "openbsd-netcat","openssh", "feh", "mc", "alsa-utils", "python-pywal", "variety", "docker", "tigervnc",
-        "docker-compose", "thunar", "nerd-fonts", "nano", "nano-syntax-highlighting", "udiskie", "freerdp2"
-    ]
-    for package in packages:
-        installed = subprocess.run(['sudo', 'pacman', '-Q', package], capture_output=True)
-        if installed.returncode != 0:
-            print(f"{package} is not installed. Installing...")
-            subprocess.run(['sudo', 'pacman', '-S', '--needed', '--noconfirm', package])
+    install_packages(PACKAGES)
             
 
 def install_yay():
 
+    if PACMAN_CONF:
+        # Bundles ship yay prebuilt
+        subprocess.run(pacman_command('-S', '--needed', '--noconfirm', 'yay'), check=True)
+        PACMAN_DB.invalidate()
+        return
+
     # Clone the yay repository
     print("Cloning yay repository...")
-    subprocess.run(["git", "clone", "https://aur.archlinux.org/yay.git"])
-
-    # Change to the yay directory
-    os.chdir('yay')
+    with tempfile.TemporaryDirectory(prefix="yay-") as workdir:
+        yay_dir = os.path.join(workdir, "yay")
+        gitcache.clone("https://aur.archlinux.org/yay.git", yay_dir, offline=OFFLINE)
 
-    # Build and install yay
-    print("Building and installing yay...")
-    subprocess.run(["makepkg", "-si"])
+        # Build and install yay. Steps can run in parallel, so use cwd= rather
+        # than changing the directory of the whole process
+        print("Building and installing yay...")
+        subprocess.run(["makepkg", "-si"], cwd=yay_dir, check=True)
+    PACMAN_DB.invalidate()
 
     print("yay has been installed successfully!")
 
-    # Change to the dots directory
-    os.chdir('..')
-
 
 def check_optional_packages():
     print("Checking and installing optional packages...")
-    optional_packages = [
-        "vscodium-bin", "udisks2", "gvfs", "vscodium-bin", "netbird-bin", "ffmpegthumbnailer", 
-        "unarchiver", "jq", "poppler", "fd", "ripgrep", "fzf", "pipewire-module-xrdp-git",
-        "zoxide", "brave-bin", "python-psutil", "python-pulsectl-asyncio", "qtile-extras"
-    ]
-    for package in optional_packages:
-        installed = subprocess.run(['sudo', 'pacman', '-Q', package], capture_output=True)
-        if installed.returncode != 0:
-            print(f"{package} is not installed. Installing...")
-            subprocess.run(['yay', '-S', "--needed", '--noconfirm', package])
+    install_packages(OPTIONAL_PACKAGES)
 
 
 def check_ssh():
     print("Checking and enabling SSH service...")
-    subprocess.run(['sudo', 'pacman', '-S', '--needed', 'openssh'])
-    subprocess.run(['sudo', 'systemctl', 'enable', 'sshd'])
-    subprocess.run(['sudo', 'systemctl', 'start', 'sshd'])
+    if not PACMAN_DB.is_installed('openssh'):
+        subprocess.run(pacman_command('-S', '--needed', 'openssh'), check=True)
+        PACMAN_DB.invalidate()
+    subprocess.run(['sudo', 'systemctl', 'enable', 'sshd'], check=True)
+    subprocess.run(['sudo', 'systemctl', 'start', 'sshd'], check=True)
 
 
 def install_wine():
     # Install wine and its dependencies
-    subprocess.run(["sudo", "pacman", "-Sy", "wine", "wine-mono", "wine-gecko"])
+    missing = [p for p in ["wine", "wine-mono", "wine-gecko"] if not PACMAN_DB.is_installed(p)]
+    if missing:
+        subprocess.run(pacman_command("-Sy", "--needed", *missing), check=True)
+        PACMAN_DB.invalidate()
 
     # Install optional dependencies for wine
-    optional_deps = subprocess.run(
-        ["pacman", "-Si", "wine"],
-        stdout=subprocess.PIPE,
-        universal_newlines=True,
-    )
-    optional_deps_output = optional_deps.stdout
-
-    start_index = optional_deps_output.find("Optional Deps")
-    end_index = optional_deps_output.find("\nConflicts With")
-
-    optional_deps_list = optional_deps_output[start_index:end_index].split("\n")[2:-1]
-    optional_deps_list = [dep.strip().split(":")[0] for dep in optional_deps_list if dep.strip()]
+    optional_deps_list = [dep for dep in PACMAN_DB.optdepends("wine") if not PACMAN_DB.is_installed(dep)]
 
     if optional_deps_list:
-        subprocess.run(["sudo", "pacman", "-S", "--asdeps", "--needed"] + optional_deps_list)
+        subprocess.run(pacman_command("-S", "--asdeps", "--needed", *optional_deps_list), check=True)
+        PACMAN_DB.invalidate()
         
 
 def install_netbird_service():
@@ -138,6 +215,7 @@ def install_netbird_service():
         print("Netbird service installed successfully.")
     except subprocess.CalledProcessError as e:
         print(f"Error installing Netbird service: {e}")
+        raise
 
 def start_netbird_service():
     try:
@@ -146,73 +224,114 @@ def start_netbird_service():
         print("Netbird service started successfully.")
     except subprocess.CalledProcessError as e:
         print(f"Error starting Netbird service: {e}")
+        raise
 
 
 def install_rofi_themes():
     print("Installing Rofi themes...")
-    subprocess.run(['git', 'clone', '--depth=1', 'https://github.com/adi1090x/rofi.git'])
-    os.chdir('rofi')  # Change the working directory to 'rofi'
-    subprocess.run(['chmod', '+x', 'setup.sh'])
-    subprocess.run(['./setup.sh'])
-    os.chdir('..')  # Change back to the parent directory
-    shutil.rmtree('rofi')  # Remove the rofi folder
+    with tempfile.TemporaryDirectory(prefix="rofi-") as workdir:
+        rofi_dir = os.path.join(workdir, "rofi")
+        gitcache.clone("https://github.com/adi1090x/rofi.git", rofi_dir, offline=OFFLINE)
+        subprocess.run(['chmod', '+x', 'setup.sh'], cwd=rofi_dir)
+        subprocess.run(['./setup.sh'], cwd=rofi_dir, check=True)
     
 
+FOLDERS_TO_CREATE = [
+    "~/Downloads",
+    "~/Pictures"
+]
+
+
 def create_folders():
     print("Creating folders...")
-    folders_to_create = [
-        os.path.expanduser("~/Downloads"),
-        os.path.expanduser("~/Pictures")
-    ]
-    for folder in folders_to_create:
-        os.makedirs(folder, exist_ok=True)
+    for folder in FOLDERS_TO_CREATE:
+        os.makedirs(os.path.expanduser(folder), exist_ok=True)
+
+
 
+FILES_TO_COPY = [
+    ("~/dots/bash/.bashrc", "~/.config"),
+    ("~/dots/libvirt/libvirtd.conf", "/etc/libvirt/"),
+    ("~/dots/tigervnc/x0vncserver.service", "/etc/systemd/system/"),
+    ("~/dots/scripts/win.sh", "~/.config/")
+]
 
 
 def copy_files():
     print("Copying files...")
-    files_to_copy = [
-        ("~/dots/bash/.bashrc", "~/.config"),
-        ("~/dots/libvirt/libvirtd.conf", "/etc/libvirt/"),
-        ("~/dots/tigervnc/x0vncserver.service", "/etc/systemd/system/"),
-        ("~/dots/scripts/win.sh", "~/.config/")
-    ]
-    for src, dest in files_to_copy:
+    for src, dest in FILES_TO_COPY:
         src = os.path.expanduser(src)
         dest = os.path.expanduser(dest)
-    try:
-        subprocess.run(['sudo', 'cp', src, dest], check=True)
-        print(f"File {dest} overwritten successfully with sudo.")
-    except subprocess.CalledProcessError as e:
-        print(f"Error overwriting file: {e}")
+        try:
+            subprocess.run(['sudo', 'cp', src, dest], check=True)
+            print(f"File {dest} overwritten successfully with sudo.")
+        except subprocess.CalledProcessError as e:
+            print(f"Error overwriting file: {e}")
+            raise
+
+
+FOLDERS_TO_COPY = [
+    ("~/dots/wallpaper", "~/Pictures/wallpapers"),
+    ("~/dots/qtile", "~/.config/qtile"),
+    ("~/dots/dunst", "~/.config/dunst"),
+    ("~/dots/picom", "~/.config/picom"),
+    ("~/dots/alacritty", "~/.config/alacritty"),
+    ("~/dots/nano", "~/.config/nano")
+]
+
+
+# Deployed as read-only generations switched by one symlink when --generations
+# is given, or once they are already linked that way
+GENERATION_FOLDERS = ["qtile", "dunst", "picom", "alacritty", "nano"]
+
+GENERATIONS = Generations()
+
+USE_GENERATIONS = False
+
+
+def generation_folders():
+    return {
+        name: (os.path.expanduser(f"~/dots/{name}"), os.path.expanduser(f"~/.config/{name}"))
+        for name in GENERATION_FOLDERS
+    }
+
+
+def uses_generations():
+    return USE_GENERATIONS or any(GENERATIONS.is_managed(dest) for _, dest in generation_folders().values())
+
+
+def deploy_generation():
+    number, changed = GENERATIONS.deploy(generation_folders())
+    if changed:
+        print(f"Switched to generation {number}")
+    else:
+        print(f"Generation {number} is current, nothing changed")
 
 
 def copy_folders():
     print("Copying folders...")
-    folders_to_copy = [
-        ("~/dots/wallpaper", "~/Pictures/wallpapers"),
-        ("~/dots/qtile", "~/.config/qtile"),
-        ("~/dots/dunst", "~/.config/dunst"),
-        ("~/dots/picom", "~/.config/picom"),
-        ("~/dots/alacritty", "~/.config/alacritty"),
-        ("~/dots/nano", "~/.config/nano")
-    ]
-    for src, dest in folders_to_copy:
+    managed = set()
+    if uses_generations():
+        deploy_generation()
+        managed = {dest for _, dest in generation_folders().values()}
+    for src, dest in FOLDERS_TO_COPY:
         src = os.path.expanduser(src)
         dest = os.path.expanduser(dest)
+        if dest in managed:
+            continue
         try:
-            shutil.copytree(src, dest)
-            print(f"Folder copied: {src} to {dest}")
+            result = sync_tree(src, dest)
+            print(f"Folder synced: {src} to {dest} "
+                  f"({len(result['copied'])} copied, {result['unchanged']} unchanged, "
+                  f"{len(result['removed'])} removed)")
         except FileNotFoundError:
             print(f"Source folder not found: {src}")
-        except FileExistsError:
-            print(f"Folder already exists at destination: {dest}")
 
 
 def setup_kvm_libvirt():
     try:
         # Get the current username
-        username = os.getlogin()
+        username = current_user()
 
         # Add the current user to the kvm and libvirt groups
         subprocess.run(['sudo', 'usermod', '-a', '-G', 'kvm', username], check=True)
@@ -226,18 +345,10 @@ def setup_kvm_libvirt():
     
     except subprocess.CalledProcessError as e:
         print(f"Error setting up KVM and libvirt: {e}")
+        raise
 
 
 
-def make_autostart_executable():
-    autostart_file = os.path.expanduser("~/.config/qtile/autostart.sh")
-    if os.path.exists(autostart_file):
-        os.chmod(autostart_file, 0o755)  # Change file permissions to make it executable
-        print(f"Made {autostart_file} executable.")
-    else:
-        print(f"File {autostart_file} not found. Skipping...")
-
-
 def set_gtk_theme(theme_name):
     try:
         # Check if entry exists
@@ -253,25 +364,409 @@ def set_gtk_theme(theme_name):
         print(f"GTK_THEME={theme_name} added successfully.")
     except subprocess.CalledProcessError as e:
         print(f"Error setting GTK theme: {e}")
+        raise
+
+# Step inputs: what each step reads and what it leaves behind on the system.
+# A step whose inputs look the same as after its last successful run is skipped.
+
+def path_hash(path):
+    try:
+        return file_hash(os.path.expanduser(path))
+    except OSError:
+        return None
+
+
+def tree_stats(path):
+    path = os.path.expanduser(path)
+    stats = []
+    for rel, full in walk_files(path):
+        st = os.lstat(full)
+        stats.append((rel, st.st_size, st.st_mtime_ns))
+    return stats
+
 
-def main():
-    backup_config()
-    install_incus()
-    overwrite_pacman_conf()
-    check_packages()
-    install_yay()
-    check_optional_packages()
-    check_ssh()
-    install_wine()
-    install_netbird_service()
-    start_netbird_service()
-    install_rofi_themes()
-    create_folders()
-    copy_files()
-    copy_folders()
-    setup_kvm_libvirt()
-    make_autostart_executable()
-    set_gtk_theme("Arc-Dark")
+def package_versions(packages):
+    return {package: PACMAN_DB.version(package) for package in packages}
+
+
+def unit_enabled(unit):
+    return bool(glob.glob(f"/etc/systemd/system/*.wants/{unit}"))
+
+
+def current_user():
+    try:
+        return os.getlogin()
+    except OSError:
+        return getpass.getuser()
+
+
+def user_groups():
+    user = current_user()
+    return sorted(g.gr_name for g in grp.getgrall() if user in g.gr_mem)
+
+
+def unit_active(unit):
+    result = subprocess.run(['systemctl', 'is-active', '--quiet', unit], capture_output=True)
+    return result.returncode == 0
+
+
+# Step changes: what each step would do to this machine right now, used by
+# --plan. They only read state, so they run without root.
+
+def backup_config_changes():
+    if not BACKUP_STORE.catalog():
+        return ["record a first backup of " + ", ".join(BACKUP_PATHS)]
+    changes = BACKUP_STORE.diff("latest")
+    changed = sum(len(paths) for paths in changes.values())
+    return [f"record a backup ({changed} files changed since the last one)"] if changed else []
+
+
+def overwrite_pacman_conf_changes():
+    if path_hash("~/dots/scripts/pacman.conf") != path_hash("/etc/pacman.conf"):
+        return ["overwrite /etc/pacman.conf with ~/dots/scripts/pacman.conf"]
+    return []
+
+
+def install_changes(packages):
+    plan = plan_packages(packages)
+    changes = [f"install {package}" for package in plan["repo"]]
+    changes += [f"install {package} (AUR)" for package in plan["aur"]]
+    return changes
+
+
+def service_changes(package, unit):
+    changes = install_changes([package])
+    if not unit_enabled(unit):
+        changes.append(f"enable {unit}")
+    if not unit_active(unit):
+        changes.append(f"start {unit}")
+    return changes
+
+
+def install_yay_changes():
+    return [] if PACMAN_DB.is_installed("yay") else ["build and install yay"]
+
+
+def install_wine_changes():
+    changes = install_changes(["wine", "wine-mono", "wine-gecko"])
+    changes += [f"install {dep} (optional dependency)" for dep in PACMAN_DB.optdepends("wine")
+                if not PACMAN_DB.is_installed(dep)]
+    return changes
+
+
+def install_netbird_service_changes():
+    if not os.path.exists("/etc/systemd/system/netbird.service"):
+        return ["install netbird.service"]
+    return []
+
+
+def start_netbird_service_changes():
+    return [] if unit_active("netbird.service") else ["start netbird.service"]
+
+
+def install_rofi_themes_changes():
+    if not os.path.isdir(os.path.expanduser("~/.config/rofi")):
+        return ["install rofi themes into ~/.config/rofi"]
+    return ["re-run the rofi theme setup.sh"]
+
+
+def create_folders_changes():
+    return [f"create {folder}" for folder in FOLDERS_TO_CREATE
+            if not os.path.isdir(os.path.expanduser(folder))]
+
+
+def copy_files_changes():
+    changes = []
+    for src, dest in FILES_TO_COPY:
+        target = os.path.expanduser(dest)
+        if dest.endswith("/") or os.path.isdir(target):
+            target = os.path.join(target, os.path.basename(src))
+        if not os.path.exists(target):
+            changes.append(f"copy {src} to {target}")
+        elif path_hash(src) != path_hash(target):
+            changes.append(f"overwrite {target} with {src}")
+    return changes
+
+
+def copy_folders_changes():
+    changes = []
+    managed = set()
+    if uses_generations():
+        folders = generation_folders()
+        changes += GENERATIONS.changes({name: src for name, (src, _) in folders.items()})
+        changes += [f"link {dest} into the current generation" for _, dest in folders.values()
+                    if not GENERATIONS.is_managed(dest)]
+        managed = {dest for _, dest in folders.values()}
+    for src, dest in FOLDERS_TO_COPY:
+        if os.path.expanduser(dest) in managed:
+            continue
+        try:
+            result = sync_tree(os.path.expanduser(src), os.path.expanduser(dest), dry_run=True)
+        except FileNotFoundError:
+            continue
+        changes += [f"{'copy' if rel in result['new'] else 'update'} {os.path.join(dest, rel)}"
+                    for rel in result["copied"]]
+        changes += [f"remove {os.path.join(dest, rel)}" for rel in result["removed"]]
+    return changes
+
+
+def setup_kvm_libvirt_changes():
+    groups = user_groups()
+    changes = [f"add {current_user()} to group {group}" for group in ("kvm", "libvirt") if group not in groups]
+    if not unit_enabled("libvirtd.service"):
+        changes.append("enable libvirtd.service")
+    if not unit_active("libvirtd.service"):
+        changes.append("start libvirtd.service")
+    return changes
+
+
+def set_gtk_theme_changes():
+    try:
+        with open("/etc/environment", encoding="utf-8") as f:
+            if f"GTK_THEME={GTK_THEME}" in f.read():
+                return []
+    except FileNotFoundError:
+        pass
+    return [f"append GTK_THEME={GTK_THEME} to /etc/environment"]
+
+
+GTK_THEME = "Arc-Dark"
+
+STEPS = [
+    Step("backup_config", backup_config, changes=backup_config_changes),
+    Step("overwrite_pacman_conf", overwrite_pacman_conf, changes=overwrite_pacman_conf_changes,
+         inputs=lambda: [path_hash("~/dots/scripts/pacman.conf"), path_hash("/etc/pacman.conf")]),
+    Step("install_incus", install_incus, needs=["overwrite_pacman_conf"], pacman=True,
+         changes=partial(install_changes, ["incus"]),
+         inputs=lambda: package_versions(["incus"])),
+    Step("check_packages", check_packages, needs=["overwrite_pacman_conf"], pacman=True,
+         changes=partial(install_changes, PACKAGES),
+         inputs=lambda: [PACKAGES, PACMAN_DB.stamp()]),
+    Step("install_yay", install_yay, needs=["check_packages"], pacman=True,
+         changes=install_yay_changes,
+         inputs=lambda: package_versions(["yay"])),
+    Step("check_optional_packages", check_optional_packages, needs=["install_yay"], pacman=True,
+         changes=partial(install_changes, OPTIONAL_PACKAGES),
+         inputs=lambda: [OPTIONAL_PACKAGES, PACMAN_DB.stamp()]),
+    Step("check_ssh", check_ssh, needs=["check_packages"], pacman=True,
+         changes=partial(service_changes, "openssh", "sshd.service"),
+         inputs=lambda: [package_versions(["openssh"]), unit_enabled("sshd.service")]),
+    Step("install_wine", install_wine, needs=["overwrite_pacman_conf"], pacman=True,
+         changes=install_wine_changes,
+         inputs=lambda: PACMAN_DB.stamp()),
+    Step("install_netbird_service", install_netbird_service, needs=["check_optional_packages"],
+         changes=install_netbird_service_changes,
+         inputs=lambda: [package_versions(["netbird-bin"]), path_hash("/etc/systemd/system/netbird.service")]),
+    Step("start_netbird_service", start_netbird_service, needs=["install_netbird_service"],
+         changes=start_netbird_service_changes),
+    Step("install_rofi_themes", install_rofi_themes, needs=["backup_config", "check_packages"],
+         changes=install_rofi_themes_changes,
+         inputs=lambda: tree_stats("~/.config/rofi")),
+    Step("create_folders", create_folders, changes=create_folders_changes),
+    Step("copy_files", copy_files, needs=["backup_config", "check_packages"], changes=copy_files_changes),
+    Step("copy_folders", copy_folders, needs=["backup_config", "create_folders"], changes=copy_folders_changes),
+    Step("setup_kvm_libvirt", setup_kvm_libvirt, needs=["check_packages", "copy_files"],
+         changes=setup_kvm_libvirt_changes,
+         inputs=lambda: [user_groups(), unit_enabled("libvirtd.service"), path_hash("/etc/libvirt/libvirtd.conf")]),
+    Step("set_gtk_theme", partial(set_gtk_theme, GTK_THEME), changes=set_gtk_theme_changes),
+]
+
+
+COMMANDS = ("install", "backup", "generations", "export-bundle", "benchmark")
+
+
+def parse_args(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # Plain `python qtile.py [options]` keeps meaning install
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv.insert(0, "install")
+
+    parser = argparse.ArgumentParser(description="Install and configure the qtile dots.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    install = commands.add_parser("install", help="provision this machine (default)")
+    install.add_argument("-j", "--jobs", type=int, default=4,
+                         help="number of steps to run at the same time (default: 4, 1 runs them in order)")
+    install.add_argument("--force", action="append", default=[], metavar="STEP",
+                         choices=[step.name for step in STEPS],
+                         help="run STEP even if it is up to date (can be repeated)")
+    install.add_argument("--offline", action="store_true",
+                         help="do not fetch git repositories, use the cached mirrors")
+    install.add_argument("--generations", action="store_true",
+                         help="deploy ~/.config folders as symlinked read-only generations")
+    install.add_argument("--plan", action="store_true",
+                         help="print what every step would change, without changing anything")
+    install.add_argument("--from-bundle", metavar="PATH",
+                         help="install packages from a bundle made by export-bundle instead of the network")
+
+    gens = commands.add_parser("generations", help="deploy, list and roll back config generations")
+    actions = gens.add_subparsers(dest="action", required=True)
+    actions.add_parser("list", help="list generations")
+    actions.add_parser("deploy", help="build a generation from ~/dots and switch to it")
+    switch = actions.add_parser("switch", help="switch to a generation")
+    switch.add_argument("number", type=int)
+    actions.add_parser("rollback", help="switch to the generation before the current one")
+    gc = actions.add_parser("gc", help="delete old generations")
+    gc.add_argument("--keep", type=int, default=5, help="generations to keep (default: 5)")
+
+    export = commands.add_parser("export-bundle", help="collect every package into an offline bundle")
+    export.add_argument("output", help="path of the bundle tarball to write")
+    export.add_argument("--offline", action="store_true",
+                        help="build AUR packages from the cached git mirrors only")
+
+    bench = commands.add_parser("benchmark", help="time the installer against stub system tools")
+    bench.add_argument("--runs", type=int, default=5, help="number of runs (default: 5)")
+    bench.add_argument("-j", "--jobs", type=int, default=4, help="steps to run at the same time (default: 4)")
+
+    backup = commands.add_parser("backup", help="inspect and restore config backups")
+    actions = backup.add_subparsers(dest="action", required=True)
+    actions.add_parser("list", help="list backups")
+    diff = actions.add_parser("diff", help="compare two backups, or one backup with the live files")
+    diff.add_argument("old")
+    diff.add_argument("new", nargs="?")
+    restore = actions.add_parser("restore", help="write files from a backup back into place")
+    restore.add_argument("id", help="backup id, or 'latest'")
+    restore.add_argument("paths", nargs="*", help="only restore these paths, e.g. ~/.config/qtile")
+    return parser.parse_args(argv)
+
+
+def backup_command(args):
+    if args.action == "list":
+        for entry in BACKUP_STORE.catalog():
+            print(f"{entry['id']:<21} {entry['files']:5d} files  {entry['bytes']:>10d} bytes  "
+                  f"{entry['new_bytes']:>10d} new")
+        return 0
+    try:
+        if args.action == "diff":
+            changes = BACKUP_STORE.diff(args.old, args.new)
+            for kind, mark in (("added", "+"), ("removed", "-"), ("modified", "M")):
+                for path in changes[kind]:
+                    print(f"{mark} {path}")
+        elif args.action == "restore":
+            restored = BACKUP_STORE.restore(args.id, args.paths)
+            print(f"Restored {len(restored)} files from {args.id}")
+    except KeyError as e:
+        print(e.args[0])
+        return 1
+    return 0
+
+
+def generations_command(args):
+    current = GENERATIONS.current()
+    numbers = GENERATIONS.numbers()
+    if args.action == "list":
+        for number in numbers:
+            meta = GENERATIONS.meta(number)
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(meta.get("time", 0)))
+            mark = "*" if number == current else " "
+            print(f"{mark} {number:4d}  {when}  {len(meta.get('files', {}))} files")
+        return 0
+    if args.action == "deploy":
+        deploy_generation()
+        return 0
+    if args.action == "gc":
+        removed = GENERATIONS.collect_garbage(args.keep)
+        print(f"Removed {len(removed)} generations")
+        return 0
+    if args.action == "rollback":
+        older = [number for number in numbers if current is not None and number < current]
+        if not older:
+            print("There is no older generation to roll back to")
+            return 1
+        target = older[-1]
+    else:
+        target = args.number
+    try:
+        GENERATIONS.switch(target)
+    except KeyError as e:
+        print(e.args[0])
+        return 1
+    for name, (_, dest) in generation_folders().items():
+        GENERATIONS.link(name, dest)
+    print(f"Switched to generation {target}")
+    return 0
+
+
+def export_bundle_command(args):
+    wanted = expand_groups(PACKAGES + OPTIONAL_PACKAGES + EXTRA_PACKAGES + PACMAN_DB.optdepends("wine"))
+    repo = [package for package in wanted if PACMAN_DB.in_repos(package)]
+    aur = [package for package in wanted if not PACMAN_DB.in_repos(package)]
+    print(f"Bundling {len(repo)} repo packages and {len(aur)} AUR packages...")
+    try:
+        manifest = bundle.export_bundle(repo, aur, args.output, PACMAN_DB.satisfiable_from_repos,
+                                        offline=args.offline)
+    except (subprocess.CalledProcessError, RuntimeError, gitcache.MirrorError) as e:
+        print(f"Error exporting bundle: {e}")
+        return 1
+    print(f"Wrote {args.output} with {len(manifest['files'])} package files")
+    return 0
+
+
+def use_bundle(path):
+    global PACMAN_CONF
+    print(f"Unpacking bundle {path}...")
+    PACMAN_CONF = bundle.unpack_bundle(path, os.path.join(gitcache.CACHE_HOME, "dots", "bundle"))
+    subprocess.run(pacman_command('-Sy'), check=True)
+    PACMAN_DB.invalidate()
+
+
+def plan_command(args):
+    state = StepState()
+    total = 0
+    for step in check_graph(STEPS):
+        if step.name not in args.force and step.inputs is not None and state.is_current(step.name, step.fingerprint()):
+            continue
+        try:
+            changes = step.changes() if step.changes else []
+        except OSError as e:
+            changes = [f"cannot tell: {e}"]
+        if not changes:
+            continue
+        total += len(changes)
+        print(f"{step.name}:")
+        for change in changes:
+            print(f"  {change}")
+    if not total:
+        print("Nothing to do, this machine matches the dots.")
+    return 0
+
+
+def install(args):
+    global OFFLINE, USE_GENERATIONS
+    OFFLINE = args.offline
+    USE_GENERATIONS = args.generations
+    if args.plan:
+        return plan_command(args)
+    # Ask for the sudo password once up front instead of from several threads
+    subprocess.run(['sudo', '-v'])
+    if args.from_bundle:
+        use_bundle(args.from_bundle)
+    recorder = timing.Recorder()
+    status = run_steps(STEPS, workers=args.jobs, state=StepState(), force=args.force, recorder=recorder)
+    recorder.print_summary()
+    failed = [name for name, result in status.items() if result in ("failed", "skipped")]
+    if failed:
+        print(f"Steps not completed: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "backup":
+        return backup_command(args)
+    if args.command == "generations":
+        return generations_command(args)
+    if args.command == "export-bundle":
+        return export_bundle_command(args)
+    if args.command == "benchmark":
+        try:
+            benchmark.benchmark(os.path.dirname(os.path.abspath(__file__)), args.runs, args.jobs)
+        except RuntimeError as e:
+            print(f"Error benchmarking the installer: {e}")
+            return 1
+        return 0
+    return install(args)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
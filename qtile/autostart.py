@@ -0,0 +1,291 @@
+"""Supervised autostart.
+
+Replaces autostart.sh, which backgrounded everything at once with no
+readiness check and started another copy on every restart. Services are
+declared in config.py and started in parallel. A service waits only for the
+services it ``needs`` to become ready. Ready means the service's ``ready``
+check passed, or that it started, if it has none. Crashed services are
+restarted with exponential backoff, and a critical notification is sent, so a
+dead compositor does not go unnoticed.
+
+reload_config re-runs every module in the config folder, but SUPERVISOR is
+carried over, so calling start() again just picks up changed declarations.
+Processes already running for this user with the same command line (after
+a qtile restart, or started by hand) are adopted instead of spawned a second
+time. A service declared with replace=True stops same-named processes that
+were started with other arguments before it starts its own.
+"""
+import asyncio
+import os
+import shlex
+import subprocess
+import time
+
+from libqtile.log_utils import logger
+
+
+class Service:
+    def __init__(self, name, command, needs=(), ready=None, ready_timeout=10.0, restart=True, replace=False):
+        self.name = name
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.needs = list(needs)
+        self.ready = ready
+        self.ready_timeout = ready_timeout
+        self.restart = restart
+        # Stop same-named processes started another way instead of running
+        # next to them, for things that can only run once like a compositor
+        self.replace = replace
+
+    @property
+    def comm(self):
+        # /proc/<pid>/comm is the executable's (or script's) name cut to 15 chars
+        return os.path.basename(self.command[0])[:15]
+
+
+def x_selection_owned(selection):
+    """Readiness check: someone owns the X selection, e.g. _NET_WM_CM_S0 for a compositor."""
+    conn = atom = None
+
+    def check():
+        nonlocal conn, atom
+        import xcffib
+
+        if conn is None:
+            conn = xcffib.connect()
+            atom = conn.core.InternAtom(False, len(selection), selection).reply().atom
+        return conn.core.GetSelectionOwner(atom).reply().owner != 0
+
+    return check
+
+
+def notify(summary, body, urgency="normal"):
+    try:
+        subprocess.Popen(["notify-send", "-a", "qtile", "-u", urgency, summary, body],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        pass
+
+
+def running(comm, uid=None):
+    """(pid, argv) of this user's live processes named comm."""
+    uid = os.getuid() if uid is None else uid
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        try:
+            if os.stat(f"/proc/{entry}").st_uid != uid:
+                continue
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except OSError:
+            continue
+        # pid (comm) state ...; comm may itself contain spaces or parentheses
+        name = stat[stat.index("(") + 1:stat.rindex(")")]
+        state = stat[stat.rindex(")") + 2:].split(" ", 1)[0]
+        if name == comm and state not in ("Z", "X"):
+            argv = [arg.decode(errors="replace") for arg in cmdline.split(b"\0")[:-1]]
+            yield int(entry), argv
+
+
+def started_as(argv, command):
+    """True if argv runs command, directly or through an interpreter (python /usr/bin/udiskie)."""
+    program, args = os.path.basename(command[0]), list(command[1:])
+    return any(
+        os.path.basename(arg) == program and argv[i + 1:] == args
+        for i, arg in enumerate(argv[:2])
+    )
+
+
+def find_running(comm, uid=None, command=None):
+    """pid of a process named comm, that also runs command if given."""
+    for pid, argv in running(comm, uid):
+        if command is None or started_as(argv, command):
+            return pid
+    return None
+
+
+class _Process:
+    def __init__(self, pid, popen=None):
+        self.pid = pid
+        self.popen = popen
+
+    @classmethod
+    def spawn(cls, command):
+        popen = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.DEVNULL, start_new_session=True)
+        return cls(popen.pid, popen)
+
+    def alive(self):
+        if self.popen is not None:
+            return self.popen.poll() is None
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    async def wait(self):
+        loop = asyncio.get_event_loop()
+        try:
+            fd = os.pidfd_open(self.pid)
+        except ProcessLookupError:
+            return self._reap()
+        exited = loop.create_future()
+        loop.add_reader(fd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await exited
+        finally:
+            loop.remove_reader(fd)
+            os.close(fd)
+        return self._reap()
+
+    def _reap(self):
+        if self.popen is not None:
+            return self.popen.wait()
+        try:
+            # Adopted processes may still be our children from before a restart
+            _, status = os.waitpid(self.pid, os.WNOHANG)
+            return os.waitstatus_to_exitcode(status) if status else None
+        except ChildProcessError:
+            return None
+
+    def terminate(self):
+        try:
+            os.kill(self.pid, 15)
+        except ProcessLookupError:
+            pass
+
+
+class Supervisor:
+    def __init__(self, backoff=1.0, max_backoff=60.0, max_failures=5, stable_after=60.0):
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_failures = max_failures
+        self.stable_after = stable_after
+        self.services = {}
+        self.processes = {}
+        self.tasks = {}
+        self.ready = {}
+        self.ready_after = {}
+        self.restarts = {}
+        self.started = None
+
+    def start(self, services):
+        loop = asyncio.get_event_loop()
+        self.started = time.monotonic()
+        self.ready_after = {}
+        wanted = {service.name: service for service in services}
+        for name in set(self.services) - set(wanted):
+            self.stop(name)
+        for service in services:
+            unknown = [need for need in service.needs if need not in wanted]
+            if unknown:
+                logger.warning("autostart: %s needs unknown services %s", service.name, ", ".join(unknown))
+                service.needs = [need for need in service.needs if need in wanted]
+        self.services = wanted
+        for name in wanted:
+            task = self.tasks.get(name)
+            if task is None or task.done():
+                self.tasks[name] = loop.create_task(self._supervise(name))
+            elif self._event(name).is_set():
+                self._mark_ready(name)
+
+    def stop(self, name):
+        self.services.pop(name, None)
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+        process = self.processes.pop(name, None)
+        if process is not None:
+            process.terminate()
+
+    def _event(self, name):
+        return self.ready.setdefault(name, asyncio.Event())
+
+    def _mark_ready(self, name):
+        self._event(name).set()
+        if name in self.ready_after:
+            return
+        self.ready_after[name] = time.monotonic() - self.started
+        if set(self.ready_after) >= set(self.services):
+            logger.info("autostart: all services ready after %.0fms (%s)",
+                        max(self.ready_after.values()) * 1000,
+                        ", ".join(f"{n} {t * 1000:.0f}ms" for n, t in sorted(self.ready_after.items())))
+
+    async def _supervise(self, name):
+        failures = 0
+        while name in self.services:
+            service = self.services[name]
+            for need in service.needs:
+                await self._event(need).wait()
+            pid = find_running(service.comm, command=service.command)
+            if pid is not None:
+                logger.info("autostart: adopting running %s (pid %d)", name, pid)
+                process = _Process(pid)
+            else:
+                if service.replace:
+                    await self._replace(service)
+                try:
+                    process = _Process.spawn(service.command)
+                except OSError as e:
+                    logger.error("autostart: cannot start %s: %s", name, e)
+                    notify(f"{name} did not start", str(e), "critical")
+                    return
+            self.processes[name] = process
+            started = time.monotonic()
+            await self._wait_ready(service, process)
+            code = await process.wait()
+            self._event(name).clear()
+            self.processes.pop(name, None)
+            if name not in self.services or not self.services[name].restart:
+                return
+            failures = 0 if time.monotonic() - started >= self.stable_after else failures + 1
+            if failures > self.max_failures:
+                logger.error("autostart: %s keeps exiting (status %s), giving up", name, code)
+                notify(f"{name} keeps crashing", f"Exited {failures} times in a row, not restarting", "critical")
+                return
+            delay = min(self.backoff * 2 ** max(failures - 1, 0), self.max_backoff)
+            self.restarts[name] = self.restarts.get(name, 0) + 1
+            logger.warning("autostart: %s exited with status %s, restarting in %gs", name, code, delay)
+            if code != 0:
+                notify(f"{name} exited", f"Status {code}, restarting in {delay:g}s", "critical")
+            await asyncio.sleep(delay)
+
+    async def _replace(self, service):
+        strays = [_Process(pid) for pid, _ in running(service.comm)]
+        for process in strays:
+            logger.info("autostart: stopping %s (pid %d) started with other arguments", service.name, process.pid)
+            process.terminate()
+        for process in strays:
+            try:
+                await asyncio.wait_for(process.wait(), 5)
+            except asyncio.TimeoutError:
+                logger.warning("autostart: %s (pid %d) did not stop", service.name, process.pid)
+
+    async def _wait_ready(self, service, process):
+        if service.ready is not None:
+            deadline = time.monotonic() + service.ready_timeout
+            while True:
+                try:
+                    if service.ready():
+                        break
+                except Exception:
+                    logger.exception("autostart: readiness check for %s failed", service.name)
+                    break
+                if not process.alive():
+                    return
+                if time.monotonic() >= deadline:
+                    logger.warning("autostart: %s not ready after %.0fs", service.name, service.ready_timeout)
+                    break
+                await asyncio.sleep(0.05)
+        self._mark_ready(service.name)
+
+
+# Keep the supervisor that owns the running services when reload_config
+# re-runs this module
+if "SUPERVISOR" not in globals():
+    SUPERVISOR = Supervisor()
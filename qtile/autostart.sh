@@ -1,5 +0,0 @@
-#!/bin/bash
-
-picom --daemon &
-udiskie &
-variety &
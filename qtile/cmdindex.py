@@ -0,0 +1,284 @@
+"""Executable index for the spawncmd prompt.
+
+widget.Prompt's "cmd" completer globs every $PATH directory and stats every
+match each time the prompt completes. ExecutableIndex scans each directory
+once and caches the names in ~/.cache/qtile/executables.json, keyed by the
+directory's mtime. While qtile runs it watches the directories with inotify
+and rescans only the one that changed. Completion is a bisect on one sorted
+list of names.
+
+Matches are ordered by frecency from a launch history kept in
+~/.local/state/qtile/launch-history.json: how often a command was run,
+weighted by how long ago.
+"""
+import asyncio
+import bisect
+import ctypes
+import ctypes.util
+import json
+import os
+import struct
+import threading
+import time
+
+from libqtile import qtile
+from libqtile.log_utils import logger
+from libqtile.widget import prompt
+
+CACHE_HOME = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+STATE_HOME = os.environ.get("XDG_STATE_HOME", os.path.expanduser("~/.local/state"))
+DEFAULT_CACHE = os.path.join(CACHE_HOME, "qtile", "executables.json")
+DEFAULT_HISTORY = os.path.join(STATE_HOME, "qtile", "launch-history.json")
+
+IN_ATTRIB = 0x004
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT = struct.Struct("iIII")
+
+# Age in days and the weight a launch that old still carries
+FRECENCY_WEIGHTS = ((4, 100), (14, 70), (31, 50), (90, 30))
+OLD_WEIGHT = 10
+
+
+def scan_dir(path):
+    names = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and os.access(entry.path, os.X_OK):
+                        names.append(entry.name)
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return names
+
+
+def path_dirs():
+    dirs = []
+    for d in os.environ.get("PATH", prompt.CommandCompleter.DEFAULTPATH).split(":"):
+        d = os.path.expanduser(d)
+        if d and d not in dirs:
+            dirs.append(d)
+    return dirs
+
+
+def dir_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class _Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+
+    def watch(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = path
+
+    def read(self):
+        """Directories that changed since the last read."""
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size + length
+                if wd in self.watches:
+                    changed.add(self.watches[wd])
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ExecutableIndex:
+    def __init__(self, cache_path=DEFAULT_CACHE, history_path=DEFAULT_HISTORY):
+        self.cache_path = cache_path
+        self.history_path = history_path
+        self.dirs = {}
+        self.names = []
+        self.history = None
+        self.rescans = 0
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._inotify = None
+        self._watching = False
+        self._pending = set()
+        self._flush = None
+
+    def load(self):
+        """Bring the index up to date, rescanning only directories whose mtime changed."""
+        with self._scan_lock:
+            cached = self.dirs
+            if not cached:
+                try:
+                    with open(self.cache_path) as f:
+                        cached = json.load(f)
+                except (OSError, ValueError):
+                    cached = {}
+            dirs = {}
+            for d in path_dirs():
+                mtime = dir_mtime(d)
+                entry = cached.get(d)
+                if entry is not None and entry[0] == mtime:
+                    dirs[d] = entry
+                else:
+                    dirs[d] = [mtime, scan_dir(d)]
+                    self.rescans += 1
+            self._replace(dirs, save=dirs != cached)
+
+    def _replace(self, dirs, save=True):
+        names = sorted({name for _, entries in dirs.values() for name in entries})
+        with self._lock:
+            self.dirs = dirs
+            self.names = names
+        if save:
+            self._save()
+
+    def _save(self):
+        tmp = self.cache_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(self.dirs, f)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logger.warning("Could not write %s: %s", self.cache_path, e)
+
+    def rescan(self, changed):
+        with self._scan_lock:
+            dirs = dict(self.dirs)
+            for d in changed:
+                if d in dirs:
+                    dirs[d] = [dir_mtime(d), scan_dir(d)]
+                    self.rescans += 1
+            self._replace(dirs)
+
+    def watch(self):
+        """Load in a worker thread and follow the PATH directories with inotify."""
+        if self._watching:
+            return
+        self._watching = True
+        try:
+            self._inotify = _Inotify()
+        except (OSError, AttributeError) as e:
+            logger.warning("cmdindex: no inotify (%s), checking mtimes on each prompt instead", e)
+        else:
+            for d in path_dirs():
+                self._inotify.watch(d)
+            asyncio.get_event_loop().add_reader(self._inotify.fd, self._on_inotify)
+        threading.Thread(target=self.load, name="cmdindex", daemon=True).start()
+
+    def refresh(self):
+        # Waits for the first load if it is still running
+        if self._inotify is None or not self.dirs:
+            self.load()
+
+    def _on_inotify(self):
+        self._pending |= self._inotify.read()
+        # Package upgrades touch a directory many times in a row
+        if self._pending and self._flush is None:
+            self._flush = qtile.call_later(0.5, self._rescan_pending)
+
+    def _rescan_pending(self):
+        changed, self._pending, self._flush = self._pending, set(), None
+        threading.Thread(target=self.rescan, args=(changed,), name="cmdindex", daemon=True).start()
+
+    def search(self, prefix):
+        with self._lock:
+            names = self.names
+        lo = bisect.bisect_left(names, prefix)
+        hi = bisect.bisect_left(names, prefix + "\U0010ffff")
+        matches = names[lo:hi]
+        scores = self.scores()
+        return sorted(matches, key=lambda name: (-scores.get(name, 0), name))
+
+    def scores(self):
+        if self.history is None:
+            try:
+                with open(self.history_path) as f:
+                    self.history = json.load(f)
+            except (OSError, ValueError):
+                self.history = {}
+        now = time.time()
+        scores = {}
+        for name, (count, last) in self.history.items():
+            age = (now - last) / 86400
+            weight = next((w for days, w in FRECENCY_WEIGHTS if age < days), OLD_WEIGHT)
+            scores[name] = count * weight
+        return scores
+
+    def launched(self, command):
+        name = os.path.basename(command.split()[0]) if command.strip() else None
+        if not name:
+            return
+        self.scores()
+        count, _ = self.history.get(name, (0, 0))
+        self.history[name] = [count + 1, time.time()]
+        tmp = self.history_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(self.history, f)
+            os.replace(tmp, self.history_path)
+        except OSError as e:
+            logger.warning("Could not write %s: %s", self.history_path, e)
+
+
+class IndexedCompleter(prompt.CommandCompleter):
+    def complete(self, txt, aliases=None):
+        # Paths and cycling through an existing lookup work as before
+        if self.lookup is None and not (txt and txt[0] in "~/"):
+            INDEX.refresh()
+            self.lookup = [(name, name) for name in INDEX.search(txt)]
+            if aliases:
+                self.lookup.extend((alias, aliases[alias]) for alias in sorted(aliases) if alias.startswith(txt))
+            self.offset = -1
+            self.lookup.append((txt, txt))
+        return prompt.CommandCompleter.complete(self, txt, aliases)
+
+
+class Prompt(prompt.Prompt):
+    """widget.Prompt completing commands from INDEX and recording launches."""
+
+    completers = {**prompt.Prompt.completers, "cmd": IndexedCompleter}
+
+    def _configure(self, qtile, bar):
+        prompt.Prompt._configure(self, qtile, bar)
+        INDEX.watch()
+
+    def start_input(self, prompt_text, callback, complete=None, *args, **kwargs):
+        if complete == "cmd":
+            run = callback
+
+            def callback(command):
+                INDEX.launched(command)
+                run(command)
+
+        prompt.Prompt.start_input(self, prompt_text, callback, complete, *args, **kwargs)
+
+
+# Keep the loaded index and its inotify watch when reload_config re-runs
+# this module
+if "INDEX" not in globals():
+    INDEX = ExecutableIndex()
@@ -0,0 +1,281 @@
+"""picom profiles that follow CPU load, battery and fullscreen windows.
+
+picom/picom.conf is the "full" profile. "balanced" and "minimal" are made
+from it by replacing a few top-level settings (see PROFILES), so the
+exclusion lists and wintypes stay in one file. Each profile is written to
+~/.cache/qtile/picom/<name>.conf. picom is started with COMMAND, whose
+--config points at the active.conf symlink there. If the profiles cannot be
+written, config.py starts picom on its own picom.conf and nothing switches.
+Switching a profile swaps that symlink and sends picom SIGUSR1, which makes
+it reload its configuration, backend included, without restarting.
+
+The profile is the cheapest one any of these ask for:
+
+- CPU load, as averaged from metrics.SAMPLER: balanced above 60% and
+  minimal above 85%. It goes back down 15 points lower.
+- battery: balanced when discharging and minimal at 20% or less.
+- a fullscreen window on a visible group: minimal.
+
+Load and battery switches are at least hold seconds apart so picom is not
+reset over and over. Fullscreen switches right away. pin() fixes a profile
+until unpin() is called. To see the state from a running session:
+
+    qtile cmd-obj -o root -f eval -a "__import__('compositor').MANAGER.report()"
+
+scripts/bench_picom.py measures each profile's frame time and CPU cost.
+"""
+import glob
+import os
+import signal
+import time
+
+from libqtile.log_utils import logger
+
+import autostart
+
+CONFIG_HOME = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+CACHE_HOME = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+BASE_CONFIG = os.path.join(CONFIG_HOME, "picom", "picom.conf")
+PROFILE_DIR = os.path.join(CACHE_HOME, "qtile", "picom")
+ACTIVE_CONFIG = os.path.join(PROFILE_DIR, "active.conf")
+COMMAND = ["picom", "--config", ACTIVE_CONFIG]
+
+# Cheapest last. Values are libconfig literals.
+PROFILES = {
+    "full": {},
+    "balanced": {
+        "shadow-radius": "6",
+        "fade-in-step": "0.08",
+        "fade-out-step": "0.08",
+        "blur-method": '"none"',
+    },
+    "minimal": {
+        "backend": '"xrender"',
+        "shadow": "false",
+        "fading": "false",
+        "corner-radius": "0",
+        "blur-method": '"none"',
+        "inactive-opacity": "1",
+        "frame-opacity": "1",
+    },
+}
+ORDER = list(PROFILES)
+
+# CPU load percent that asks for each profile after the first
+CPU_THRESHOLDS = (60, 85)
+CPU_HYSTERESIS = 15
+LOW_BATTERY = 20
+
+
+def render_profile(base, overrides):
+    """picom.conf text with overrides replacing (or added after) top-level settings."""
+    lines = []
+    left = dict(overrides)
+    for line in base.splitlines():
+        # Top-level settings start at column 0, nested ones are indented
+        key = line.split("=", 1)[0].split(":", 1)[0].strip()
+        if line[:1].isalpha() and key in left:
+            line = f"{key} = {left.pop(key)};"
+        lines.append(line)
+    lines.extend(f"{key} = {value};" for key, value in left.items())
+    return "\n".join(lines) + "\n"
+
+
+def write_profiles(base_path=BASE_CONFIG, profile_dir=PROFILE_DIR, extra=None):
+    """Write every profile next to each other, returns {name: path}."""
+    with open(base_path) as f:
+        base = f.read()
+    os.makedirs(profile_dir, exist_ok=True)
+    paths = {}
+    for name, overrides in PROFILES.items():
+        path = os.path.join(profile_dir, f"{name}.conf")
+        text = f"# Generated from {base_path} for the {name} profile\n"
+        text += render_profile(base, {**overrides, **(extra or {})})
+        with open(path + ".tmp", "w") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+        paths[name] = path
+    return paths
+
+
+def battery():
+    """(discharging, lowest capacity) over all batteries, or None without one."""
+    found = None
+    for supply in glob.glob("/sys/class/power_supply/*"):
+        try:
+            with open(os.path.join(supply, "type")) as f:
+                if f.read().strip() != "Battery":
+                    continue
+            with open(os.path.join(supply, "status")) as f:
+                discharging = f.read().strip() == "Discharging"
+            with open(os.path.join(supply, "capacity")) as f:
+                capacity = int(f.read())
+        except (OSError, ValueError):
+            continue
+        if found is None:
+            found = (discharging, capacity)
+        else:
+            found = (found[0] or discharging, min(found[1], capacity))
+    return found
+
+
+def fullscreen_visible(qtile):
+    return any(w.fullscreen for screen in qtile.screens if screen.group for w in screen.group.windows)
+
+
+class ProfileManager:
+    def __init__(self, hold=10.0, smoothing=0.2, battery_interval=30.0):
+        self.hold = hold
+        self.smoothing = smoothing
+        self.battery_interval = battery_interval
+        self.profile = ORDER[0]
+        self.reason = "default"
+        self.pinned = None
+        self.paths = {}
+        self.cpu = None
+        self.cpu_level = 0
+        self.battery = None
+        self.fullscreen = False
+        self.switches = 0
+        self.time_in = {name: 0.0 for name in ORDER}
+        self._since = time.monotonic()
+        self._last_switch = 0
+        self._battery_read = 0
+        self._sampler = None
+        self._pending = None
+
+    def install(self):
+        """Write the profiles and point active.conf at the current one, before picom starts.
+
+        Returns False if that failed and picom cannot be started with COMMAND.
+        """
+        try:
+            self.paths = write_profiles()
+        except OSError as e:
+            logger.warning("compositor: cannot write picom profiles: %s", e)
+            self.paths = {}
+            return False
+        return self._link(self.profile)
+
+    def start(self, qtile, sampler):
+        if self._sampler is not sampler:
+            # Follow whichever sampler config.py passes in
+            if self._sampler is not None:
+                self._sampler.unsubscribe(self._on_sample)
+            self._sampler = sampler
+            sampler.subscribe(self._on_sample)
+        self.changed(qtile)
+
+    def changed(self, qtile, *_):
+        """Windows changed state, check for fullscreen once the hooks are done."""
+        if self._pending is None:
+            self._pending = qtile.call_soon(self._check_fullscreen, qtile)
+
+    def _check_fullscreen(self, qtile):
+        self._pending = None
+        fullscreen = fullscreen_visible(qtile)
+        if fullscreen != self.fullscreen:
+            self.fullscreen = fullscreen
+            self.evaluate(urgent=True)
+
+    def _on_sample(self, snapshot):
+        load = snapshot.get("load_percent", 0.0)
+        self.cpu = load if self.cpu is None else self.cpu + (load - self.cpu) * self.smoothing
+        now = time.monotonic()
+        if now - self._battery_read >= self.battery_interval:
+            self._battery_read = now
+            self.battery = battery()
+        self.evaluate()
+
+    def wanted(self):
+        level, reason = 0, "idle"
+        if self.cpu is not None:
+            while self.cpu_level < len(CPU_THRESHOLDS) and self.cpu > CPU_THRESHOLDS[self.cpu_level]:
+                self.cpu_level += 1
+            while self.cpu_level and self.cpu < CPU_THRESHOLDS[self.cpu_level - 1] - CPU_HYSTERESIS:
+                self.cpu_level -= 1
+            if self.cpu_level:
+                level, reason = self.cpu_level, f"cpu {self.cpu:.0f}%"
+        if self.battery is not None and self.battery[0]:
+            battery_level = 2 if self.battery[1] <= LOW_BATTERY else 1
+            if battery_level > level:
+                level, reason = battery_level, f"battery {self.battery[1]}%"
+        if self.fullscreen:
+            level, reason = len(ORDER) - 1, "fullscreen window"
+        return ORDER[level], reason
+
+    def evaluate(self, urgent=False):
+        if self.pinned is not None:
+            profile, reason = self.pinned, "pinned"
+        else:
+            profile, reason = self.wanted()
+        if profile == self.profile:
+            return
+        if not urgent and time.monotonic() - self._last_switch < self.hold:
+            return
+        self.switch(profile, reason)
+
+    def pin(self, profile):
+        if profile not in PROFILES:
+            raise ValueError(f"no picom profile {profile!r}, have {', '.join(ORDER)}")
+        self.pinned = profile
+        self.evaluate(urgent=True)
+
+    def unpin(self):
+        self.pinned = None
+        self.evaluate(urgent=True)
+
+    def switch(self, profile, reason):
+        if not self._link(profile):
+            return
+        now = time.monotonic()
+        self.time_in[self.profile] += now - self._since
+        self._since = self._last_switch = now
+        logger.info("compositor: %s -> %s (%s)", self.profile, profile, reason)
+        self.profile, self.reason = profile, reason
+        self.switches += 1
+        self._reload_picom()
+
+    def _link(self, profile):
+        path = self.paths.get(profile)
+        if path is None:
+            return False
+        tmp = ACTIVE_CONFIG + ".tmp"
+        try:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            os.symlink(path, tmp)
+            os.replace(tmp, ACTIVE_CONFIG)
+        except OSError as e:
+            logger.warning("compositor: cannot switch to %s: %s", profile, e)
+            return False
+        return True
+
+    def _reload_picom(self):
+        process = autostart.SUPERVISOR.processes.get("picom")
+        pid = process.pid if process is not None else autostart.find_running("picom", command=COMMAND)
+        if pid is None:
+            return
+        try:
+            os.kill(pid, signal.SIGUSR1)
+        except ProcessLookupError:
+            pass
+
+    def report(self):
+        time_in = dict(self.time_in)
+        time_in[self.profile] += time.monotonic() - self._since
+        lines = [
+            f"profile {self.profile} ({self.reason}), {self.switches} switches"
+            + (f", pinned to {self.pinned}" if self.pinned else ""),
+            f"  cpu {self.cpu or 0:.0f}%, battery {self.battery or 'none'}, fullscreen {self.fullscreen}",
+        ]
+        lines.extend(f"  {name:9} {seconds / 60:7.1f} min" for name, seconds in time_in.items())
+        text = "\n".join(lines)
+        logger.info("compositor:\n%s", text)
+        return text
+
+
+# Keep the current profile and its history when reload_config re-runs this
+# module
+if "MANAGER" not in globals():
+    MANAGER = ProfileManager()
@@ -24,15 +24,37 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from libqtile import bar, layout, qtile, widget
-from libqtile.config import Click, Drag, Group, Key, Match, Screen
-from libqtile.lazy import lazy
-from libqtile.utils import guess_terminal
-from libqtile import hook
-from qtile_extras import widget
-from qtile_extras.widget.decorations import RectDecoration
 import os
-import subprocess
+
+# Times this file on every start and reload, see loadprofile.py
+import loadprofile
+
+PROFILE = loadprofile.Profile()
+
+with PROFILE.phase("import libqtile"):
+    from libqtile import bar, layout, qtile
+    from libqtile.config import Click, Drag, Group, Key, Match, Rule
+    from libqtile.lazy import lazy
+    from libqtile import hook
+with PROFILE.phase("import qtile_extras"):
+    # Widget modules behind this are only imported when first used
+    from qtile_extras import widget
+    from qtile_extras.widget import modify
+
+with PROFILE.phase("import config modules"):
+    import autostart
+    import cmdindex
+    import compositor
+    import dragrate
+    import drawcache
+    import graphs
+    import hotplug
+    import metrics
+    import rules
+    import spawner
+    import throttle
+    import volume
+    import wallpaper
 
 mod = "mod4"
 terminal = "alacritty"
@@ -67,12 +89,15 @@ keys = [
     # Unsplit = 1 window displayed, like Max layout, but still with
     # multiple stack panes
     Key([mod, "shift"], "s", lazy.layout.toggle_split(), desc="Toggle between split and unsplit sides of stack",),
-    Key([mod], "Return", lazy.spawn(terminal), desc="Launch terminal"),
-    Key([mod, "shift"], "Return", lazy.spawn("rofi -show drun"), desc='Run Launcher'),
-    Key([mod], "b", lazy.spawn(browser), desc='Web browser'),
-    Key([mod], "m", lazy.spawn(filemanager), desc='File Manager'),
-    Key([mod], "e", lazy.spawn(ide), desc='IDE'),
-    Key([mod], "w", lazy.spawn(os.path.expanduser("~/.config/win.sh")), desc='Windows'),
+    # spawner.spawn is lazy.spawn plus key-to-window latency, see spawner.py
+    Key([mod], "Return", spawner.spawn(spawner.terminal_command(terminal)), desc="Launch terminal"),
+    # rofi cannot be kept running, but its desktop file cache skips parsing every .desktop file
+    Key([mod, "shift"], "Return", spawner.spawn("rofi -show drun -drun-use-desktop-cache", override_redirect=True),
+        desc='Run Launcher'),
+    Key([mod], "b", spawner.spawn(browser), desc='Web browser'),
+    Key([mod], "m", spawner.spawn(filemanager), desc='File Manager'),
+    Key([mod], "e", spawner.spawn(ide), desc='IDE'),
+    Key([mod], "w", spawner.spawn(os.path.expanduser("~/.config/win.sh"), wm_class="xfreerdp"), desc='Windows'),
     # Toggle between different layouts as defined below
     Key([mod], "Tab", lazy.next_layout(), desc="Toggle between layouts"),
     Key([mod], "q", lazy.window.kill(), desc="Kill focused window"),
@@ -155,78 +180,112 @@ extension_defaults = widget_defaults.copy()
 
 decor = {
     "decorations": [
-        RectDecoration(colour="#353f4f", radius=5, filled=True, padding_y=4, group=False)
+        drawcache.CachedRectDecoration(colour="#353f4f", radius=5, filled=True, padding_y=4, group=False)
     ],
     "padding": 10,
 }
 
-screens = [
-    Screen(
-        #wallpaper='~/Pictures/wallpapers/tron_legacy1.jpg',
-        #wallpaper_mode='fill',
-        top=bar.Bar(
+# Times every widget built in here, see loadprofile.py
+with PROFILE.widgets():
+    # Widgets that poll or listen are built once. Bars on further screens get
+    # the same instances, which qtile shows there through Mirror widgets.
+    # Net, Memory and CPU share one /proc sampler, see metrics.py
+    net = modify(metrics.Net, format='{down:.0f}{down_suffix} ↓↑ {up:.0f}{up_suffix}', **decor)
+    net_graph = modify(graphs.NetGraph, **decor)
+    memory = modify(metrics.Memory, measure_mem='G', **decor)
+    memory_graph = modify(graphs.MemoryGraph, graph_color="#a3be8c", **decor)
+    cpu = modify(metrics.CPU, **decor)
+    cpu_graph = modify(graphs.CPUGraph, graph_color="#ebcb8b", **decor)
+    # Redraws on PulseAudio/PipeWire sink events instead of polling
+    volume_widget = modify(volume.Volume, fmt = '♪ Vol: {}', **decor)
+    # The format has no seconds, so tick on the minute. Stops while the bar is
+    # hidden, see throttle.py
+    clock = modify(throttle.Clock, format="%a %d-%m-%Y %I:%M %p", update_interval=60, **decor)
+
+
+    def make_bar(index):
+        """Bar for screen `index`, see hotplug.py."""
+        primary = index == 0
+        return bar.Bar(
             [
-        #widget.CurrentLayout(),
-        widget.Spacer(length=10),
-        widget.GroupBox(active="#ffffff", inactive="#929493", highlight_method="block", **decor),
-        widget.Spacer(length=10),
-		widget.Prompt(**decor),
-		widget.Spacer(bar.STRETCH),
-        #widget.WindowName(),
-                widget.Chord(
-                    chords_colors={
-                        "launch": ("#ff0000", "#ffffff"),
-                    },
-                    name_transform=lambda name: name.upper(),
-                ),
-		widget.Spacer(length=10),
-        widget.Net(format='{down:.0f}{down_suffix} ↓↑ {up:.0f}{up_suffix}', **decor),
-		widget.Spacer(length=10),
-        widget.Memory(measure_mem='G', **decor),
-		widget.Spacer(length=10),
-        widget.CPU(**decor),
-		widget.Spacer(length=10),
-        #widget.Clipboard(background="888888", **powerline),
-        widget.Volume(fmt = '♪ Vol: {}', **decor),
-		widget.Spacer(length=10),
-        #widget.TextBox("default config", name="default"),
-        #widget.TextBox("Press &lt;M-r&gt; to spawn", foreground="#d75f5f"),
-        # NB Systray is incompatible with Wayland, consider using StatusNotifier instead
-        # widget.StatusNotifier(),
-        widget.Systray(),
-		widget.Spacer(length=10),
-        widget.Clock(format="%a %d-%m-%Y %I:%M %p", **decor),
-		widget.Spacer(length=10),
-        widget.QuickExit(default_text='[X]', countdown_format='[{}]', **decor),
-        widget.Spacer(length=10),
+            #widget.CurrentLayout(),
+            widget.Spacer(length=10),
+            widget.GroupBox(active="#ffffff", inactive="#929493", highlight_method="block", **decor),
+            widget.Spacer(length=10),
+            # spawncmd always opens the prompt named "prompt", so only the first bar has one
+            # Completes from a cached, inotify-maintained PATH index, see cmdindex.py
+            *([modify(cmdindex.Prompt, **decor)] if primary else []),
+            widget.Spacer(bar.STRETCH),
+            #widget.WindowName(),
+            widget.Chord(
+                chords_colors={
+                    "launch": ("#ff0000", "#ffffff"),
+                },
+                name_transform=lambda name: name.upper(),
+            ),
+            widget.Spacer(length=10),
+            net,
+            net_graph,
+            widget.Spacer(length=10),
+            memory,
+            memory_graph,
+            widget.Spacer(length=10),
+            cpu,
+            cpu_graph,
+            widget.Spacer(length=10),
+            #widget.Clipboard(background="888888", **powerline),
+            volume_widget,
+            widget.Spacer(length=10),
+            #widget.TextBox("default config", name="default"),
+            #widget.TextBox("Press &lt;M-r&gt; to spawn", foreground="#d75f5f"),
+            # NB Systray is incompatible with Wayland, consider using StatusNotifier instead
+            # widget.StatusNotifier(),
+            # There can only be one systray
+            *([widget.Systray(), widget.Spacer(length=10)] if primary else []),
+            clock,
+            widget.Spacer(length=10),
+            widget.QuickExit(default_text='[X]', countdown_format='[{}]', **decor),
+            widget.Spacer(length=10),
             ],
             24,
             border_width=[0, 0, 0, 0],
             background="#00000000",
             # border_width=[2, 0, 2, 0],  # Draw top and bottom borders
             # border_color=["ff00ff", "000000", "ff00ff", "000000"]  # Borders are magenta
-        ),
-        # You can uncomment this variable if you see that on X11 floating resize/moving is laggy
-        # By default we handle these events delayed to already improve performance, however your system might still be struggling
-        # This variable is set to None (no cap) by default, but you can set it to 60 to indicate that you limit it to 60 events per second
-        # x11_drag_polling_rate = 60,
-    ),
-]
+        )
+
+
+    # One Screen per connected output, rebuilt when an output comes back
+    SCREENS = hotplug.ScreenFactory(
+        make_bar,
+        # x11_drag_polling_rate is left at None (no cap), the mouse bindings
+        # below pace floating moves/resizes themselves, see dragrate.py
+    )
+    screens = SCREENS.screens
 
 # Drag floating layouts.
+# Motion is coalesced to the newest position and applied at a rate that
+# follows the measured frame time, see dragrate.py
 mouse = [
-    Drag([mod], "Button1", lazy.window.set_position_floating(), start=lazy.window.get_position()),
-    Drag([mod], "Button3", lazy.window.set_size_floating(), start=lazy.window.get_size()),
+    Drag([mod], "Button1", lazy.function(dragrate.PACER.motion, "position"), start=lazy.window.get_position()),
+    Drag([mod], "Button3", lazy.function(dragrate.PACER.motion, "size"), start=lazy.window.get_size()),
     Click([mod], "Button2", lazy.window.bring_to_front()),
 ]
 
 dgroups_key_binder = None
 dgroups_app_rules = []  # type: list
+# Applied from client_new through an indexed lookup instead of dgroups, see rules.py
+app_rules = rules.AppRules([
+    Rule(Match(wm_class="brave-browser"), group="2"),
+    Rule(Match(wm_class="vscodium"), group="3"),
+    Rule(Match(wm_class="virt-manager"), group="4"),
+    Rule(Match(wm_class="xfreerdp"), group="4"),
+])
 follow_mouse_focus = True
 bring_front_click = False
 floats_kept_above = True
 cursor_warp = False
-floating_layout = layout.Floating(
+floating_layout = rules.Floating(
     float_rules=[
         # Run the utility of `xprop` to see the wm class and name of an X client.
         *layout.Floating.default_float_rules,
@@ -240,7 +299,8 @@ floating_layout = layout.Floating(
 )
 auto_fullscreen = True
 focus_on_window_activation = "smart"
-reconfigure_screens = True
+# Screen changes go through SCREENS.changed, see the screen_change hook below
+reconfigure_screens = False
 
 # If things like steam games want to auto-minimize themselves when losing
 # focus, should we respect this or not?
@@ -249,10 +309,98 @@ auto_minimize = True
 # When using the Wayland backend, this can be used to configure input devices.
 wl_input_rules = None
 
-@hook.subscribe.startup
-def autostart():
-    home = os.path.expanduser('~/.config/qtile/autostart.sh')
-    subprocess.Popen([home])
+
+def picom_service():
+    # Reads the active profile, switched live by compositor.py. Without the
+    # profiles picom runs on its own picom.conf. Replaces a picom left running
+    # with another config, which would ignore the profile switches.
+    command = compositor.COMMAND if compositor.MANAGER.install() else ["picom"]
+    return autostart.Service("picom", command, ready=autostart.x_selection_owned("_NET_WM_CM_S0"),
+                             replace=True)
+
+
+services = [
+    autostart.Service("udiskie", "udiskie"),
+    # Serves `alacritty msg create-window` for the terminal binding
+    autostart.Service("alacritty", "alacritty --daemon"),
+]
+
+with PROFILE.phase("hooks"):
+    @hook.subscribe.startup_complete
+    @hook.subscribe.config_reloaded
+    @hook.subscribe.screens_reconfigured
+    def track_bar_damage():
+        drawcache.DAMAGE.watch_bars(qtile)
+
+    # Supervised, see autostart.py. Runs on every start and reload, services
+    # that are already running are kept rather than started again.
+    @hook.subscribe.startup
+    @hook.subscribe.config_reloaded
+    def start_services():
+        autostart.SUPERVISOR.start([picom_service(), *services])
+
+    # picom profile follows CPU load, battery and fullscreen windows
+    @hook.subscribe.startup_complete
+    @hook.subscribe.config_reloaded
+    def compositor_profiles():
+        compositor.MANAGER.start(qtile, metrics.SAMPLER)
+
+    @hook.subscribe.float_change
+    @hook.subscribe.setgroup
+    @hook.subscribe.client_killed
+    def compositor_fullscreen(*_):
+        compositor.MANAGER.changed(qtile)
+
+    # Bar updates slow down while idle and pause while the bar can't be seen
+    @hook.subscribe.startup_complete
+    @hook.subscribe.config_reloaded
+    def throttle_bar():
+        throttle.THROTTLE.start(qtile, metrics.SAMPLER)
+
+    @hook.subscribe.float_change
+    @hook.subscribe.setgroup
+    @hook.subscribe.client_killed
+    @hook.subscribe.client_focus
+    @hook.subscribe.screens_reconfigured
+    def throttle_visibility(*_):
+        throttle.THROTTLE.changed(qtile)
+
+    @hook.subscribe.suspend
+    def throttle_suspend():
+        throttle.THROTTLE.suspend(qtile)
+
+    @hook.subscribe.resume
+    def throttle_resume():
+        throttle.THROTTLE.resume(qtile)
+
+    # Rotates ~/Pictures/wallpapers pre-scaled per screen, see wallpaper.py
+    @hook.subscribe.startup_complete
+    @hook.subscribe.config_reloaded
+    @hook.subscribe.screens_reconfigured
+    def start_wallpapers():
+        wallpaper.ENGINE.start("~/Pictures/wallpapers", interval=900)
+
+    @hook.subscribe.startup_complete
+    @hook.subscribe.config_reloaded
+    def screens_for_outputs():
+        SCREENS.sync(qtile)
+
+    @hook.subscribe.screen_change
+    def hotplug_screens(event):
+        SCREENS.changed(qtile)
+
+    @hook.subscribe.client_new
+    def place_window(window):
+        app_rules.apply(window)
+
+    @hook.subscribe.client_managed
+    def spawn_latency(window):
+        spawner.TRACKER.window_mapped(window)
+
+    @hook.subscribe.startup_complete
+    @hook.subscribe.config_reloaded
+    def finish_profile():
+        PROFILE.finish()
 
 
 # XXX: Gasp! We're lying here. In fact, nobody really uses or cares about this
@@ -264,3 +412,5 @@ def autostart():
 # We choose LG3D to maximize irony: it is a 3D non-reparenting WM written in
 # java that happens to be on java's whitelist.
 wmname = "Qtile"
+
+PROFILE.config_evaluated()
@@ -0,0 +1,125 @@
+"""Adaptive frame rate for moving and resizing floating windows.
+
+The stock Drag bindings call set_position_floating/set_size_floating for
+every motion event. x11_drag_polling_rate can only cap that at a fixed rate,
+and it does so by dropping events. The last motion of a drag can be one of
+the dropped ones, so the window stops a few pixels short of the pointer.
+
+DragPacer takes the motion events instead. It keeps only the newest pointer
+position and applies it at most once per frame. After each move or resize
+it waits for the X server to answer a round trip, so the frame time covers
+qtile's work and the server's. The frame interval follows a moving average
+of that time, clamped between min_rate and max_rate. A fast machine drags at
+the pointer's own rate and a slow one drops to what it can present. Because
+the newest position is always applied at the end, a drag ends exactly under
+the pointer.
+
+Latency is measured from the first motion event that went into a frame until
+that frame was done. To see percentiles from a running session:
+
+    qtile cmd-obj -o root -f eval -a "__import__('dragrate').PACER.report()"
+"""
+import time
+from collections import deque
+
+from libqtile.log_utils import logger
+
+
+class DragPacer:
+    def __init__(self, min_rate=30, max_rate=240, headroom=1.25, smoothing=0.2, keep=2000):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.frame_time = 1 / max_rate
+        self.latencies = deque(maxlen=keep)
+        self.frame_times = deque(maxlen=keep)
+        self.events = 0
+        self.frames = 0
+        self._window = None
+        self._kind = None
+        self._target = None
+        self._received = None
+        self._last_frame = 0
+        self._timer = None
+
+    @property
+    def interval(self):
+        interval = self.frame_time * self.headroom
+        return min(max(interval, 1 / self.max_rate), 1 / self.min_rate)
+
+    @property
+    def rate(self):
+        return 1 / self.interval
+
+    def motion(self, qtile, kind, x, y):
+        """Drag command for kind "position" or "size", qtile appends x and y."""
+        window = qtile.current_window
+        if window is None:
+            return
+        if (window, kind) != (self._window, self._kind) and self._timer is not None:
+            # Finish the previous drag before starting another
+            self._timer.cancel()
+            self._apply(qtile)
+        self._window, self._kind = window, kind
+        self.events += 1
+        if self._target is None:
+            self._received = time.perf_counter()
+        # Anything not yet applied is replaced by the newest position
+        self._target = (x, y)
+        if self._timer is not None:
+            return
+        delay = self._last_frame + self.interval - time.perf_counter()
+        if delay <= 0:
+            self._apply(qtile)
+        else:
+            self._timer = qtile.call_later(delay, self._apply, qtile)
+
+    def _apply(self, qtile):
+        self._timer = None
+        target, self._target = self._target, None
+        window = self._window
+        if target is None or window is None or window.wid not in qtile.windows_map:
+            return
+        start = time.perf_counter()
+        try:
+            if self._kind == "size":
+                window.set_size_floating(*target)
+            else:
+                window.set_position_floating(*target)
+            if qtile.core.name == "x11":
+                # Returns once the server has handled the configure requests
+                qtile.core.conn.conn.core.GetInputFocus().reply()
+        except Exception:
+            logger.exception("dragrate: could not %s %s", self._kind, window.name)
+            return
+        done = time.perf_counter()
+        frame = done - start
+        self.frame_time += (frame - self.frame_time) * self.smoothing
+        self.frame_times.append(frame * 1000)
+        self.latencies.append((done - self._received) * 1000)
+        self._last_frame = done
+        self.frames += 1
+
+    @staticmethod
+    def _percentiles(samples):
+        samples = sorted(samples)
+        return [samples[min(len(samples) - 1, len(samples) * p // 100)] for p in (50, 90, 99)]
+
+    def report(self):
+        if not self.frames:
+            text = "no drags recorded"
+        else:
+            lines = [
+                f"{self.events} motion events in {self.frames} frames,"
+                f" {self.events - self.frames} coalesced, now pacing at {self.rate:.0f} Hz",
+            ]
+            for label, samples in (("latency", self.latencies), ("frame", self.frame_times)):
+                p50, p90, p99 = self._percentiles(samples)
+                lines.append(f"  {label:8} p50 {p50:.1f}ms, p90 {p90:.1f}ms, p99 {p99:.1f}ms")
+            text = "\n".join(lines)
+        logger.info("drag pacing:\n%s", text)
+        return text
+
+
+PACER = DragPacer()
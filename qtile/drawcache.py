@@ -0,0 +1,107 @@
+"""Cheaper bar redraws.
+
+CachedRectDecoration renders its rounded rectangle once per widget size and
+colour into an image surface and afterwards only paints that surface, so a
+clock tick no longer rebuilds the rounded path on every draw.
+
+DamageTracker wraps each bar widget's drawer to count draws and the area
+copied to the bar window, which is also what the X server reports to picom
+as damage. It only measures and skips no draws. The metrics widgets are
+what repaint only themselves instead of the whole bar when their text
+changes, see metrics._Metric.update. To see the numbers from a running
+session:
+
+    qtile cmd-obj -o root -f eval -a "__import__('drawcache').DAMAGE.report()"
+"""
+import time
+from collections import Counter
+
+import cairocffi
+from libqtile.log_utils import logger
+from qtile_extras.widget.decorations import RectDecoration
+
+
+class CachedRectDecoration(RectDecoration):
+    def __init__(self, **config):
+        RectDecoration.__init__(self, **config)
+        self._cache_key = None
+        self._cache = None
+        self.renders = 0
+
+    def draw(self):
+        parent = self.parent
+        if self.group or self.clip or not self.width:
+            # Grouped decorations depend on the neighbours' positions and
+            # clipping has to act on the widget's own context
+            RectDecoration.draw(self)
+            return
+        width, height = self.width, self.height
+        key = (width, height, str(self.colour), str(parent.background))
+        drawer = parent.drawer
+        if key != self._cache_key:
+            self._cache = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, width, height)
+            real_ctx = drawer.ctx
+            drawer.ctx = cairocffi.Context(self._cache)
+            try:
+                RectDecoration.draw(self)
+            finally:
+                drawer.ctx = real_ctx
+            self._cache_key = key
+            self.renders += 1
+        ctx = drawer.ctx
+        # The widget may have resized itself, as in RectDecoration.draw
+        ctx.reset_clip()
+        ctx.save()
+        ctx.set_source_surface(self._cache, 0, 0)
+        ctx.paint()
+        ctx.restore()
+
+
+class DamageTracker:
+    def __init__(self):
+        self.draws = Counter()
+        self.pixels = Counter()
+        self.since = time.monotonic()
+        self._watched = set()
+
+    def watch(self, widget):
+        drawer = getattr(widget, "drawer", None)
+        if drawer is None or id(drawer) in self._watched:
+            return
+        self._watched.add(id(drawer))
+        name = widget.name
+        draw = drawer.draw
+
+        def counted_draw(*args, **kwargs):
+            width = kwargs.get("width") or drawer.width
+            height = kwargs.get("height") or drawer.height
+            self.draws[name] += 1
+            self.pixels[name] += width * height
+            return draw(*args, **kwargs)
+
+        drawer.draw = counted_draw
+
+    def watch_bars(self, qtile):
+        for screen in qtile.screens:
+            for bar in (screen.top, screen.bottom, screen.left, screen.right):
+                for widget in getattr(bar, "widgets", None) or []:
+                    self.watch(widget)
+
+    def reset(self):
+        self.draws.clear()
+        self.pixels.clear()
+        self.since = time.monotonic()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.since, 1e-9)
+        lines = [f"{'widget':<24}{'draws/s':>10}{'px/s':>12}"]
+        for name, count in self.draws.most_common():
+            lines.append(f"{name:<24}{count / elapsed:>10.2f}{self.pixels[name] / elapsed:>12.0f}")
+        lines.append(f"{'total':<24}{sum(self.draws.values()) / elapsed:>10.2f}"
+                     f"{sum(self.pixels.values()) / elapsed:>12.0f}")
+        text = "\n".join(lines)
+        logger.info("bar damage over %.0fs:\n%s", elapsed, text)
+        return text
+
+
+DAMAGE = DamageTracker()
@@ -0,0 +1,171 @@
+"""Sparkline history graphs for the metrics sampler.
+
+Each graph keeps its samples in a fixed-size ``array('d')`` ring buffer and
+its picture in a cached cairo surface. A new sample shifts the cached
+surface one column to the left and draws just the newest column, so the
+Python work per tick is the same however long the history is; the bar
+redraw itself only blits the cached surface.
+"""
+from array import array
+
+import cairocffi
+from libqtile import utils
+from libqtile.widget import base
+
+import metrics
+
+
+class RingBuffer:
+    def __init__(self, size):
+        self.size = size
+        self.values = array("d", bytes(8 * size))
+        self.index = 0
+        self.count = 0
+
+    def push(self, value):
+        """Store ``value`` and return the one it replaced."""
+        old = self.values[self.index]
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        return old
+
+    def __iter__(self):
+        # Oldest first
+        start = self.index if self.count == self.size else 0
+        for i in range(self.count):
+            yield self.values[(start + i) % self.size]
+
+
+class History(base._Widget):
+    defaults = [
+        ("key", "load_percent", "Sampler snapshot key to plot"),
+        ("maximum", 100, "Value at the top of the graph, None to scale to the largest sample"),
+        ("samples", 180, "Number of samples kept (one per sampler tick)"),
+        ("column_width", 1, "Width in pixels of one sample"),
+        ("padding", 6, "Space left and right of the graph"),
+        ("margin_y", 6, "Space above and below the graph"),
+        ("graph_color", "#8fbcbb", "Colour of the graph"),
+        ("sampler", None, "Sampler to read from, None for the shared one"),
+    ]
+
+    def __init__(self, **config):
+        base._Widget.__init__(self, 0, **config)
+        self.add_defaults(History.defaults)
+        self.length = self.samples * self.column_width + 2 * self.padding
+        self.buffer = RingBuffer(self.samples)
+        self.scale = 1.0
+        self.full_redraws = 0
+        self.column_draws = 0
+        self._surface = None
+        self._spare = None
+
+    def _configure(self, qtile, bar):
+        base._Widget._configure(self, qtile, bar)
+        self._color = utils.rgb(self.graph_color)
+        self.scale = self.maximum or self.scale
+        if not self.configured:
+            self._sampler = self.sampler or metrics.SAMPLER
+            self._sampler.subscribe(self._on_sample)
+
+    def finalize(self):
+        self._sampler.unsubscribe(self._on_sample)
+        base._Widget.finalize(self)
+
+    @property
+    def graph_width(self):
+        return self.samples * self.column_width
+
+    @property
+    def graph_height(self):
+        return max(1, self.bar.height - 2 * self.margin_y)
+
+    def _new_surface(self):
+        return cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, self.graph_width, self.graph_height)
+
+    def _column(self, ctx, x, value):
+        height = self.graph_height
+        bar_height = min(height, max(0.0, value / self.scale * height))
+        ctx.set_operator(cairocffi.OPERATOR_CLEAR)
+        ctx.rectangle(x, 0, self.column_width, height)
+        ctx.fill()
+        ctx.set_operator(cairocffi.OPERATOR_OVER)
+        ctx.set_source_rgba(*self._color)
+        ctx.rectangle(x, height - bar_height, self.column_width, bar_height)
+        ctx.fill()
+
+    def _redraw_all(self):
+        self.full_redraws += 1
+        if self._surface is None or self._surface.get_height() != self.graph_height:
+            self._surface = self._new_surface()
+            self._spare = self._new_surface()
+        ctx = cairocffi.Context(self._surface)
+        offset = self.samples - self.buffer.count
+        ctx.set_operator(cairocffi.OPERATOR_CLEAR)
+        ctx.paint()
+        for i, value in enumerate(self.buffer):
+            self._column(ctx, (offset + i) * self.column_width, value)
+
+    def _shift_in(self, value):
+        self.column_draws += 1
+        # Copy the picture one column to the left into the spare surface,
+        # draw the new column there and swap the two
+        ctx = cairocffi.Context(self._spare)
+        ctx.set_operator(cairocffi.OPERATOR_SOURCE)
+        ctx.set_source_surface(self._surface, -self.column_width, 0)
+        ctx.paint()
+        self._column(ctx, self.graph_width - self.column_width, value)
+        self._surface, self._spare = self._spare, self._surface
+
+    def _rescale_needed(self, value, dropped):
+        if self.maximum:
+            return False
+        if value > self.scale:
+            self.scale = value
+            return True
+        if dropped >= self.scale and self.buffer.count == self.samples:
+            # The largest sample just left the window: a full scan, but only
+            # when the peak drops out
+            self.scale = max(max(self.buffer.values), 1.0)
+            return True
+        return False
+
+    def _on_sample(self, snapshot):
+        value = float(snapshot.get(self.key, 0.0))
+        dropped = self.buffer.push(value)
+        if self._surface is None or self._rescale_needed(value, dropped):
+            self._redraw_all()
+        else:
+            self._shift_in(value)
+        self.draw()
+
+    def draw(self):
+        self.drawer.clear(self.background or self.bar.background)
+        if self._surface is not None:
+            self.drawer.ctx.set_source_surface(self._surface, self.padding, self.margin_y)
+            self.drawer.ctx.paint()
+        self.drawer.draw(offsetx=self.offset, offsety=self.offsety, width=self.length)
+
+
+class CPUGraph(History):
+    defaults = [("key", "load_percent", ""), ("maximum", 100, "")]
+
+    def __init__(self, **config):
+        History.__init__(self, **config)
+        self.add_defaults(CPUGraph.defaults)
+
+
+class MemoryGraph(History):
+    defaults = [("key", "MemPercent", ""), ("maximum", 100, "")]
+
+    def __init__(self, **config):
+        History.__init__(self, **config)
+        self.add_defaults(MemoryGraph.defaults)
+
+
+class NetGraph(History):
+    defaults = [("key", "down", ""), ("maximum", None, "")]
+
+    def __init__(self, **config):
+        History.__init__(self, **config)
+        self.add_defaults(NetGraph.defaults)
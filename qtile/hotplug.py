@@ -0,0 +1,79 @@
+"""Screens for any number of outputs from one bar template.
+
+With reconfigure_screens qtile only has the screens listed in the config.
+Any extra output gets a bare Screen without a bar. ScreenFactory builds
+one Screen per output from a make_bar(index) template.
+
+Widget instances that the template passes to several bars are shown
+through qtile's Mirror widgets. So a second monitor redraws the same
+CPU/memory/clock widgets rather than adding another set that polls.
+
+qtile finalizes the bar of an output that goes away: its window is killed
+and its widget list emptied. So the Screen is dropped, the bar's own
+widgets and mirrors are finalized too, and the shared widgets stop drawing
+into it. An output that comes back gets a fresh Screen and Bar from
+make_bar, around the same shared widget instances.
+
+config.py sets reconfigure_screens = False and forwards screen_change to
+changed(), which logs how long the change took.
+"""
+import time
+
+from libqtile.config import Screen
+from libqtile.log_utils import logger
+
+
+def output_count(qtile):
+    # Outputs at the same position are one screen to qtile, as in _process_screens
+    return len({(info.x, info.y) for info in qtile.core.get_screen_info()})
+
+
+class ScreenFactory:
+    def __init__(self, make_bar, **screen_options):
+        self.make_bar = make_bar
+        self.screen_options = screen_options
+        self.screens = []
+        self.ensure(1)
+
+    def ensure(self, count):
+        built = 0
+        while len(self.screens) < count:
+            self.screens.append(Screen(top=self.make_bar(len(self.screens)), **self.screen_options))
+            built += 1
+        return built
+
+    def sync(self, qtile):
+        """Give outputs that were present before the config loaded their bars."""
+        if output_count(qtile) > len(self.screens):
+            self.changed(qtile)
+
+    def changed(self, qtile, *_):
+        start = time.perf_counter()
+        before = len(qtile.screens)
+        # The first bar holds the shared widgets every other bar mirrors
+        count = max(output_count(qtile), 1)
+        retired = self.screens[count:]
+        del self.screens[count:]
+        # Bar.finalize() empties the list, so take the widgets first
+        widgets = [w for screen in retired if screen.top is not None for w in screen.top.widgets]
+        built = self.ensure(count)
+        # qtile reads config.screens, which is self.screens
+        qtile.reconfigure_screens()
+        self._release(qtile, widgets)
+        logger.info("hotplug: %d -> %d screens in %.1fms, %d bars built, %d removed",
+                    before, len(qtile.screens), (time.perf_counter() - start) * 1000,
+                    built, len(retired))
+
+    @staticmethod
+    def _release(qtile, widgets):
+        """Finalize the widgets of removed bars, Mirror.finalize() detaches from the shared widget."""
+        for widget in widgets:
+            if not widget.configured:
+                continue
+            try:
+                widget.finalize()
+            except Exception:
+                logger.exception("hotplug: could not finalize %s", widget.name)
+        for name, widget in list(qtile.widgets_map.items()):
+            if widget in widgets:
+                del qtile.widgets_map[name]
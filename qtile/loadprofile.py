@@ -0,0 +1,117 @@
+"""Config load profiler.
+
+config.py runs top to bottom on every start and on every reload_config,
+while the window manager is frozen. Profile splits that time into phases
+(imports, widget construction, hook registration) and, once qtile fires
+startup_complete or config_reloaded, adds the time qtile itself spent
+configuring the bars. Every load is logged and appended as one JSON line to
+~/.local/state/qtile/config-load.jsonl.
+
+Widget construction is timed per widget by noting when each widget object
+is allocated. Widgets are built in list order, so the gap between one
+widget and the next is what that widget cost.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+STATE_HOME = os.environ.get("XDG_STATE_HOME", os.path.expanduser("~/.local/state"))
+DEFAULT_LOG = os.path.join(STATE_HOME, "qtile", "config-load.jsonl")
+
+# reload_config re-runs this module in its old namespace, so the count
+# survives reloads. lazy.restart() starts a new process, which counts as a
+# start again.
+if "LOADS" not in globals():
+    LOADS = 0
+
+
+class Profile:
+    def __init__(self, log_path=DEFAULT_LOG):
+        self.log_path = log_path
+        global LOADS
+        LOADS += 1
+        self.loads = LOADS
+        self.kind = "start" if self.loads == 1 else "reload"
+        self.start = time.perf_counter()
+        self.evaluated = None
+        self.phases = []
+        self.widget_times = []
+        self.finished = False
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    @contextmanager
+    def widgets(self):
+        """Time each widget created inside the block."""
+        from libqtile.widget import base
+
+        created = []
+        start = time.perf_counter()
+        original_new = base._Widget.__dict__.get("__new__")
+
+        def noted_new(cls, *args, **kwargs):
+            created.append((cls.__name__, time.perf_counter()))
+            return object.__new__(cls)
+
+        base._Widget.__new__ = noted_new
+        try:
+            yield
+        finally:
+            # Also when the config raises, so qtile's fallback config gets
+            # the real _Widget
+            if original_new is None:
+                del base._Widget.__new__
+            else:
+                base._Widget.__new__ = original_new
+        end = time.perf_counter()
+        self.phases.append(("widgets", end - start))
+        stamps = [stamp for _, stamp in created[1:]] + [end]
+        previous = start
+        for (name, _), stamp in zip(created, stamps):
+            self.widget_times.append((name, stamp - previous))
+            previous = stamp
+
+    def config_evaluated(self):
+        self.evaluated = time.perf_counter()
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        end = time.perf_counter()
+        evaluated = self.evaluated or end
+        record = {
+            "time": time.time(),
+            "kind": self.kind,
+            "config_s": round(evaluated - self.start, 6),
+            "configure_s": round(end - evaluated, 6),
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases},
+            "widgets": [[name, round(seconds, 6)] for name, seconds in self.widget_times],
+        }
+        from libqtile.log_utils import logger
+
+        logger.info("config %s: %s", self.kind, self.summary(record))
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning("Could not write %s: %s", self.log_path, e)
+        return record
+
+    @staticmethod
+    def summary(record):
+        parts = [f"config {record['config_s'] * 1000:.1f}ms", f"configure {record['configure_s'] * 1000:.1f}ms"]
+        parts += [f"{name} {seconds * 1000:.1f}ms" for name, seconds in record["phases"].items()]
+        slowest = sorted(record["widgets"], key=lambda item: item[1], reverse=True)[:3]
+        if slowest:
+            parts.append("slowest widgets " + ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in slowest))
+        return "; ".join(parts)
+
@@ -0,0 +1,297 @@
+"""One sampler for the CPU, memory and network widgets.
+
+The stock widgets each run their own timer and go through psutil. Here a
+single Sampler reads /proc/stat, /proc/meminfo and /proc/net/dev once per
+tick (through file descriptors kept open, so there is no open/close per
+read) and hands the same snapshot to every widget subscribed to it. The
+timer only runs while something is subscribed, and the descriptors are
+closed when the last subscriber leaves. CPU frequencies come from the
+cpufreq policies in /sys, like psutil.cpu_freq().
+"""
+import glob
+import math
+import os
+import time
+
+from libqtile import qtile
+from libqtile.log_utils import logger
+from libqtile.widget import base
+
+MEMINFO_KEYS = {
+    b"MemTotal:": "MemTotal",
+    b"MemFree:": "MemFree",
+    b"MemAvailable:": "MemAvailable",
+    b"Buffers:": "Buffers",
+    b"Cached:": "Cached",
+    b"Shmem:": "Shmem",
+    b"SwapTotal:": "SwapTotal",
+    b"SwapFree:": "SwapFree",
+}
+
+MEMORY_KEYS = list(MEMINFO_KEYS.values()) + ["MemUsed", "SwapUsed"]
+
+
+class Sampler:
+    def __init__(self, interval=1.0, interfaces=None):
+        self.interval = interval
+        self.interfaces = interfaces
+        self.snapshot = {}
+        self.subscribers = []
+        self.ticks = 0
+        self.paused = False
+        self._fds = {}
+        self._freq_paths = {}
+        self._timer = None
+        self._last_cpu = None
+        self._last_net = None
+        self._last_time = None
+
+    def subscribe(self, callback):
+        # Widgets subscribe from _configure, before the bar is ready to draw,
+        # so the first delivery waits for the next loop iteration
+        self.subscribers.append(callback)
+        if self.paused:
+            return
+        if self._timer is None:
+            self._timer = qtile.call_soon(self._tick)
+        elif self.snapshot:
+            qtile.call_soon(callback, self.snapshot)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+        if not self.subscribers:
+            self.stop()
+            self.close()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+
+    def pause(self):
+        """Stop ticking but keep the subscribers, see throttle.py."""
+        self.paused = True
+        self.stop()
+
+    def resume(self):
+        """Sample right away and go on ticking every interval."""
+        self.paused = False
+        if self.subscribers:
+            self.stop()
+            self._tick()
+
+    def _read(self, path, size=65536):
+        fd = self._fds.get(path)
+        if fd is None:
+            fd = self._fds[path] = os.open(path, os.O_RDONLY)
+        return os.pread(fd, size, 0)
+
+    def _freq_files(self, name):
+        # One file per cpufreq policy, not per CPU
+        if name not in self._freq_paths:
+            self._freq_paths[name] = sorted(glob.glob(f"/sys/devices/system/cpu/cpufreq/policy*/{name}"))
+        return self._freq_paths[name]
+
+    def _freq(self, snapshot):
+        # The same values widget.CPU gets from psutil.cpu_freq(), in GHz
+        for key, name in (("freq_current", "scaling_cur_freq"), ("freq_max", "cpuinfo_max_freq"),
+                          ("freq_min", "cpuinfo_min_freq")):
+            paths = self._freq_files(name)
+            if paths:
+                khz = [int(self._read(path)) for path in paths]
+                snapshot[key] = round(sum(khz) / len(khz) / 1e6, 1)
+            else:
+                snapshot[key] = 0.0
+        if not self._freq_files("scaling_cur_freq"):
+            mhz = [float(line.split(b":")[1]) for line in self._read("/proc/cpuinfo", 1 << 20).split(b"\n")
+                   if line.startswith(b"cpu MHz")]
+            if mhz:
+                snapshot["freq_current"] = round(sum(mhz) / len(mhz) / 1000, 1)
+
+    def _cpu(self, snapshot):
+        fields = self._read("/proc/stat").split(b"\n", 1)[0].split()[1:]
+        ticks = [int(field) for field in fields]
+        total = sum(ticks[:8])  # guest time is already counted in user
+        idle = ticks[3] + ticks[4]
+        if self._last_cpu is not None:
+            d_total = total - self._last_cpu[0]
+            d_idle = idle - self._last_cpu[1]
+            snapshot["load_percent"] = round(100.0 * (d_total - d_idle) / d_total, 1) if d_total else 0.0
+        else:
+            snapshot["load_percent"] = 0.0
+        self._last_cpu = (total, idle)
+        self._freq(snapshot)
+
+    def _memory(self, snapshot):
+        values = {}
+        for line in self._read("/proc/meminfo").split(b"\n"):
+            key, _, rest = line.partition(b" ")
+            name = MEMINFO_KEYS.get(key)
+            if name is not None:
+                values[name] = int(rest.split()[0]) * 1024
+        total = values.get("MemTotal", 0)
+        available = values.get("MemAvailable", values.get("MemFree", 0))
+        values["MemUsed"] = total - available
+        values["MemPercent"] = round(100.0 * values["MemUsed"] / total, 1) if total else 0.0
+        values["SwapUsed"] = values.get("SwapTotal", 0) - values.get("SwapFree", 0)
+        snapshot.update(values)
+
+    def _net(self, snapshot, elapsed):
+        rx = tx = 0
+        for line in self._read("/proc/net/dev").split(b"\n")[2:]:
+            name, _, counters = line.partition(b":")
+            name = name.strip()
+            if not name or name == b"lo":
+                continue
+            if self.interfaces and name.decode() not in self.interfaces:
+                continue
+            fields = counters.split()
+            rx += int(fields[0])
+            tx += int(fields[8])
+        if self._last_net is not None and elapsed > 0:
+            snapshot["down"] = max(0, rx - self._last_net[0]) / elapsed
+            snapshot["up"] = max(0, tx - self._last_net[1]) / elapsed
+        else:
+            snapshot["down"] = snapshot["up"] = 0.0
+        self._last_net = (rx, tx)
+
+    def sample(self):
+        now = time.monotonic()
+        elapsed = now - self._last_time if self._last_time is not None else 0
+        self._last_time = now
+        snapshot = {"time": now}
+        self._cpu(snapshot)
+        self._memory(snapshot)
+        self._net(snapshot, elapsed)
+        return snapshot
+
+    def _tick(self):
+        self._timer = qtile.call_later(self.interval, self._tick)
+        try:
+            self.snapshot = self.sample()
+        except (OSError, ValueError, IndexError):
+            logger.exception("metrics: could not sample /proc")
+            return
+        self.ticks += 1
+        for callback in list(self.subscribers):
+            callback(self.snapshot)
+
+
+# Keep the running sampler and its subscribers when reload_config re-runs
+# this module
+if "SAMPLER" not in globals():
+    SAMPLER = Sampler()
+
+
+class _Metric(base._TextBox):
+    defaults = [
+        ("sampler", None, "Sampler to read from, None for the shared one"),
+    ]
+
+    def __init__(self, **config):
+        base._TextBox.__init__(self, "", **config)
+        self.add_defaults(_Metric.defaults)
+        self._widest = 0
+
+    def calculate_length(self):
+        # Never shrink, so only text wider than any before needs the bar
+        # laid out again, see update()
+        self._widest = max(self._widest, base._TextBox.calculate_length(self))
+        return self._widest
+
+    def update(self, text):
+        # _TextBox.update redraws the whole bar whenever the text's own width
+        # changes. The widget keeps its length unless the text grew past it,
+        # so otherwise repainting this widget is enough.
+        if not self.can_draw() or self.text == text:
+            return
+        length = self._widest
+        self.text = text or ""
+        if self.calculate_length() == length and (self.bar.horizontal or self.rotate):
+            self.draw()
+        else:
+            self.bar.draw()
+
+    def _configure(self, qtile, bar):
+        base._TextBox._configure(self, qtile, bar)
+        # Screen changes configure the widget again, keep one subscription
+        if not self.configured:
+            self._sampler = self.sampler or SAMPLER
+            self._sampler.subscribe(self._on_sample)
+
+    def finalize(self):
+        self._sampler.unsubscribe(self._on_sample)
+        base._TextBox.finalize(self)
+
+    def _on_sample(self, snapshot):
+        text = self.render(snapshot)
+        if text != self.text:
+            self.update(text)
+
+    def render(self, snapshot):
+        raise NotImplementedError
+
+
+class CPU(_Metric):
+    defaults = [
+        ("format", "CPU {freq_current}GHz {load_percent}%", "Keys: load_percent, freq_current, freq_max, freq_min"),
+    ]
+
+    def __init__(self, **config):
+        _Metric.__init__(self, **config)
+        self.add_defaults(CPU.defaults)
+
+    def render(self, snapshot):
+        return self.format.format(**snapshot)
+
+
+class Memory(_Metric):
+    defaults = [
+        ("format", "{MemUsed: .0f}{mm}/{MemTotal: .0f}{mm}",
+         "Keys: MemUsed, MemTotal, MemFree, MemAvailable, Buffers, Cached, Shmem, "
+         "SwapTotal, SwapFree, SwapUsed (scaled by measure_mem), MemPercent, mm"),
+        ("measure_mem", "M", "Unit for memory values: 'K', 'M', 'G' or 'T'"),
+    ]
+
+    def __init__(self, **config):
+        _Metric.__init__(self, **config)
+        self.add_defaults(Memory.defaults)
+        self._divisor = 1024 ** ("BKMGT".index(self.measure_mem.upper()))
+
+    def render(self, snapshot):
+        values = {key: snapshot[key] / self._divisor for key in MEMORY_KEYS if key in snapshot}
+        values["MemPercent"] = snapshot["MemPercent"]
+        return self.format.format(mm=self.measure_mem.upper(), **values)
+
+
+class Net(_Metric):
+    defaults = [
+        ("format", "{down:.0f}{down_suffix} ↓↑ {up:.0f}{up_suffix}",
+         "Keys: down, down_suffix, up, up_suffix"),
+        ("prefix", None, "Fixed unit prefix such as 'k' or 'M', None to pick one per value"),
+    ]
+
+    def __init__(self, **config):
+        _Metric.__init__(self, **config)
+        self.add_defaults(Net.defaults)
+
+    def convert(self, num_bytes):
+        letters = ["B", "kB", "MB", "GB", "TB"]
+        if self.prefix is not None:
+            power = letters.index(self.prefix + "B") if self.prefix else 0
+        elif num_bytes > 0:
+            power = max(0, min(int(math.log(num_bytes, 1000)), len(letters) - 1))
+        else:
+            power = 0
+        return num_bytes / 1000 ** power, letters[power]
+
+    def render(self, snapshot):
+        down, down_suffix = self.convert(snapshot["down"])
+        up, up_suffix = self.convert(snapshot["up"])
+        return self.format.format(down=down, down_suffix=down_suffix, up=up, up_suffix=up_suffix)
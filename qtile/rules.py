@@ -0,0 +1,145 @@
+"""Indexed window rules for floating and app-to-group placement.
+
+Floating.match and dgroups try every Match against every new window. A
+RuleIndex files each Match under one of its exact string values (wm_class,
+wm_type, role, wm_instance_class or title) in a dict. A new window then only
+looks up its own values. Rules that have no exact value, such as regexes,
+``func=`` and MatchAll/MatchAny/InvertMatch, are kept in a fallback list
+that is still scanned. Candidates are re-checked with Match.compare, so
+rules behave as before, and they are tried in their original order.
+
+Every rule that decides a window gets a hit counted. To see them from a
+running session:
+
+    qtile cmd-obj -o root -f eval -a "__import__('rules').report()"
+"""
+from collections import Counter
+
+from libqtile import layout
+from libqtile.config import Match
+from libqtile.log_utils import logger
+
+# Tried in this order when picking the key a Match is filed under
+INDEXED = ("wm_class", "wm_type", "role", "wm_instance_class", "title")
+
+
+def window_values(window, prop):
+    if prop == "wm_class":
+        return window.get_wm_class() or ()
+    if prop == "wm_instance_class":
+        wm_class = window.get_wm_class()
+        return wm_class[:1] if wm_class else ()
+    if prop == "wm_type":
+        return (window.get_wm_type(),)
+    if prop == "role":
+        return (window.get_wm_role(),)
+    return (window.name,)
+
+
+class RuleIndex:
+    def __init__(self, matches):
+        self.matches = list(matches)
+        self.index = {prop: {} for prop in INDEXED}
+        self.fallback = []
+        self.hits = Counter()
+        for position, match in enumerate(self.matches):
+            key = self._key(match)
+            if key is None:
+                self.fallback.append(position)
+            else:
+                self.index[key[0]].setdefault(key[1], []).append(position)
+
+    @staticmethod
+    def _key(match):
+        # Only plain Match objects expose their properties
+        rules = getattr(match, "_rules", None) if type(match) is Match else None
+        if not rules:
+            return None
+        for prop in INDEXED:
+            if isinstance(rules.get(prop), str):
+                return prop, rules[prop]
+        return None
+
+    def candidates(self, window):
+        positions = list(self.fallback)
+        for prop, table in self.index.items():
+            if not table:
+                continue
+            for value in window_values(window, prop):
+                positions.extend(table.get(value, ()))
+        positions.sort()
+        return positions
+
+    def first(self, window):
+        """Position of the first rule matching window, or None."""
+        for position in self.candidates(window):
+            if self.matches[position].compare(window):
+                self.hits[position] += 1
+                return position
+        return None
+
+    def report(self, title):
+        lines = [f"{title}: {len(self.matches)} rules, {len(self.fallback)} scanned on every window"]
+        for position, count in self.hits.most_common():
+            lines.append(f"  {count:6}  {self.matches[position]!r}")
+        return "\n".join(lines)
+
+
+class Floating(layout.Floating):
+    """layout.Floating deciding float_rules through a RuleIndex."""
+
+    def __init__(self, float_rules=None, **config):
+        layout.Floating.__init__(self, float_rules=float_rules, **config)
+        self.rule_index = RuleIndex(self.float_rules)
+        INDEXES["float_rules"] = self.rule_index
+
+    def match(self, win):
+        return self.rule_index.first(win) is not None
+
+
+class AppRules:
+    """Group placement for libqtile.config.Rule objects, like dgroups_app_rules.
+
+    Each Rule is indexed through its matchlist. Matching rules are applied
+    in order until one has break_on_match set, as dgroups does.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        owners = []
+        matches = []
+        for number, rule in enumerate(self.rules):
+            for match in rule.matchlist:
+                owners.append(number)
+                matches.append(match)
+        self._owners = owners
+        self.rule_index = RuleIndex(matches)
+        INDEXES["app_rules"] = self.rule_index
+
+    def apply(self, window):
+        applied = set()
+        for position in self.rule_index.candidates(window):
+            number = self._owners[position]
+            if number in applied or not self.rule_index.matches[position].compare(window):
+                continue
+            self.rule_index.hits[position] += 1
+            applied.add(number)
+            rule = self.rules[number]
+            if rule.group:
+                try:
+                    window.togroup(rule.group)
+                except Exception:
+                    logger.exception("rules: could not move %s to %s", window.name, rule.group)
+            if rule.float:
+                window.enable_floating()
+            if rule.break_on_match:
+                break
+
+
+INDEXES = {}
+
+
+def report():
+    text = "\n".join(index.report(name) for name, index in sorted(INDEXES.items())) or "no rule indexes"
+    logger.info("window rules:\n%s", text)
+    return text
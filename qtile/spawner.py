@@ -0,0 +1,173 @@
+"""Key press to window latency for spawn bindings.
+
+spawn() is a drop-in for lazy.spawn that also notes when the key was
+pressed. LatencyTracker matches that against the next window with the
+expected WM_CLASS that qtile manages. config.py forwards client_managed to
+window_mapped(). Override-redirect windows such as rofi never reach qtile,
+so for those a separate X connection listens for map events on the root
+window.
+
+Latencies go into a histogram per binding and are appended to
+~/.local/state/qtile/spawn-latency.jsonl to be tracked over time. To see the
+histograms from a running session:
+
+    qtile cmd-obj -o root -f eval -a "__import__('spawner').TRACKER.report()"
+
+The terminal binding uses ``alacritty msg create-window``, which asks an
+already running alacritty (the daemon started from autostart) for a new
+window. That skips process startup and font loading, and falls back to a
+fresh alacritty if none is running.
+"""
+import asyncio
+import bisect
+import json
+import os
+import shlex
+import time
+from collections import Counter, deque
+
+from libqtile.lazy import lazy
+from libqtile.log_utils import logger
+
+STATE_HOME = os.environ.get("XDG_STATE_HOME", os.path.expanduser("~/.local/state"))
+DEFAULT_LOG = os.path.join(STATE_HOME, "qtile", "spawn-latency.jsonl")
+
+# Exclusive upper bounds in milliseconds, the last bucket takes everything slower
+BUCKETS_MS = (10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000, 2000)
+
+
+def terminal_command(terminal):
+    return f"{terminal} msg create-window || exec {terminal}"
+
+
+class LatencyTracker:
+    def __init__(self, log_path=DEFAULT_LOG, timeout=10.0, keep=200):
+        self.log_path = log_path
+        self.timeout = timeout
+        self.pending = []
+        self.histograms = {}
+        self.recent = {}
+        self.keep = keep
+        self.missed = Counter()
+        self._xconn = None
+        self._xproto = None
+
+    def expect(self, name, wm_class, override_redirect=False):
+        self._expire()
+        if override_redirect and not self._watch_x():
+            return
+        self.pending.append((name, wm_class.lower(), time.monotonic(), override_redirect))
+
+    def window_mapped(self, window):
+        if not self.pending:
+            return
+        self._match(window.get_wm_class() or [], override_redirect=False)
+
+    def _match(self, classes, override_redirect):
+        self._expire()
+        classes = [c.lower() for c in classes if c]
+        for i, (name, wm_class, started, override) in enumerate(self.pending):
+            if override == override_redirect and any(c.startswith(wm_class) for c in classes):
+                del self.pending[i]
+                self.record(name, time.monotonic() - started)
+                return
+
+    def _expire(self):
+        now = time.monotonic()
+        for name, _, started, _ in self.pending:
+            if now - started > self.timeout:
+                self.missed[name] += 1
+        self.pending = [p for p in self.pending if now - p[2] <= self.timeout]
+
+    def _watch_x(self):
+        if self._xconn is not None:
+            return True
+        try:
+            import xcffib
+            import xcffib.xproto
+
+            conn = xcffib.connect()
+            root = conn.get_setup().roots[conn.pref_screen].root
+            # Another client may listen for substructure events too, only
+            # redirecting them is reserved for the window manager
+            conn.core.ChangeWindowAttributes(root, xcffib.xproto.CW.EventMask,
+                                             [xcffib.xproto.EventMask.SubstructureNotify])
+            conn.flush()
+            asyncio.get_event_loop().add_reader(conn.get_file_descriptor(), self._read_x)
+        except Exception:
+            logger.exception("spawner: cannot watch X windows for override-redirect spawns")
+            return False
+        self._xproto = xcffib.xproto
+        self._xconn = conn
+        return True
+
+    def _read_x(self):
+        while True:
+            try:
+                event = self._xconn.poll_for_event()
+            except Exception:
+                # An X error for a window that went away before we asked
+                continue
+            if event is None:
+                return
+            if not isinstance(event, self._xproto.MapNotifyEvent) or not event.override_redirect:
+                continue
+            if not any(p[3] for p in self.pending):
+                continue
+            try:
+                prop = self._xconn.core.GetProperty(False, event.window, self._xproto.Atom.WM_CLASS,
+                                                    self._xproto.Atom.STRING, 0, 64).reply()
+            except Exception:
+                continue
+            self._match(prop.value.to_string().split("\0"), override_redirect=True)
+
+    def record(self, name, seconds):
+        ms = seconds * 1000
+        counts = self.histograms.setdefault(name, [0] * (len(BUCKETS_MS) + 1))
+        counts[bisect.bisect_right(BUCKETS_MS, ms)] += 1
+        self.recent.setdefault(name, deque(maxlen=self.keep)).append(ms)
+        logger.debug("spawner: %s mapped after %.1fms", name, ms)
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps({"time": time.time(), "binding": name, "ms": round(ms, 2)}) + "\n")
+        except OSError as e:
+            logger.warning("Could not write %s: %s", self.log_path, e)
+
+    def report(self):
+        labels = [f"<{b}" for b in BUCKETS_MS] + [f">={BUCKETS_MS[-1]}"]
+        lines = []
+        for name, counts in sorted(self.histograms.items()):
+            samples = sorted(self.recent[name])
+            p50 = samples[len(samples) // 2]
+            p90 = samples[min(len(samples) - 1, len(samples) * 9 // 10)]
+            lines.append(f"{name}: {sum(counts)} spawns, p50 {p50:.1f}ms, p90 {p90:.1f}ms,"
+                         f" {self.missed[name]} without a window")
+            width = max(counts)
+            for label, count in zip(labels, counts):
+                if count:
+                    lines.append(f"  {label:>6}ms {count:5} {'#' * max(1, count * 40 // width)}")
+        text = "\n".join(lines) or "no spawns recorded"
+        logger.info("spawn latency:\n%s", text)
+        return text
+
+
+# Keep the histograms and the X connection when reload_config re-runs this
+# module
+if "TRACKER" not in globals():
+    TRACKER = LatencyTracker()
+
+
+def _spawn(qtile, command, name, wm_class, override_redirect):
+    TRACKER.expect(name, wm_class, override_redirect)
+    qtile.spawn(command, shell=any(c in command for c in "|&;"))
+
+
+def spawn(command, wm_class=None, name=None, override_redirect=False):
+    """lazy.spawn(command) that records how long the window takes to appear.
+
+    wm_class defaults to the executable's name and is matched
+    case-insensitively against the start of the window's classes.
+    """
+    program = os.path.basename(shlex.split(command)[0])
+    return lazy.function(_spawn, command, name or program, wm_class or program, override_redirect)
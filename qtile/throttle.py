@@ -0,0 +1,227 @@
+"""Slow down or pause bar updates while nobody can see the bar.
+
+Throttle is in one of three states:
+
+- visible: everything updates at its normal rate.
+- idle: no keyboard or mouse input for idle_after seconds, as reported by
+  the X screensaver extension. metrics.SAMPLER ticks every idle_interval
+  seconds instead of every second.
+- hidden: the screensaver is on, the machine is suspending, or every
+  screen shows a fullscreen window or has its bar hidden. The sampler is
+  paused. The Clock here and volume.Volume put their updates off until the
+  bar shows again.
+
+Leaving hidden or idle samples and redraws everything at once. The X
+screensaver extension sends an event when the screensaver turns on or off.
+config.py forwards focus, fullscreen and group changes to changed(). So
+only the return from idle has to be noticed by polling, and that check rides
+on the sampler's slow ticks.
+
+Every timer that did not fire counts as an avoided wakeup. To see them,
+and the time spent in each state, from a running session:
+
+    qtile cmd-obj -o root -f eval -a "__import__('throttle').THROTTLE.report()"
+"""
+import asyncio
+import time
+from collections import Counter
+
+from libqtile import qtile
+from libqtile.log_utils import logger
+from libqtile.widget import clock
+
+STATES = ("visible", "idle", "hidden")
+
+
+def bars_covered(qtile):
+    """True when no screen shows its bar."""
+    for screen in qtile.screens:
+        if screen.top is None or not screen.top.is_show():
+            continue
+        if screen.group is None or not any(w.fullscreen for w in screen.group.windows):
+            return False
+    return True
+
+
+class _ScreenSaver:
+    """Idle time and screensaver state of the X server, with change events."""
+
+    def __init__(self, on_change):
+        import xcffib
+        import xcffib.screensaver
+
+        self._screensaver = xcffib.screensaver
+        self.conn = xcffib.connect()
+        self.ext = self.conn(xcffib.screensaver.key)
+        self.root = self.conn.get_setup().roots[self.conn.pref_screen].root
+        self.ext.SelectInput(self.root, xcffib.screensaver.Event.NotifyMask)
+        self.conn.flush()
+        self.on_change = on_change
+        asyncio.get_event_loop().add_reader(self.conn.get_file_descriptor(), self._read)
+
+    def _read(self):
+        while self.conn.poll_for_event():
+            self.on_change()
+
+    def query(self):
+        """(screensaver on, seconds since the last input)"""
+        info = self.ext.QueryInfo(self.root).reply()
+        return info.state == self._screensaver.State.On, info.ms_since_user_input / 1000
+
+
+class Throttle:
+    def __init__(self, idle_after=120.0, idle_interval=5.0):
+        self.idle_after = idle_after
+        self.idle_interval = idle_interval
+        self.state = "visible"
+        self.reason = "start"
+        self.suspended = False
+        self.avoided = Counter()
+        self.time_in = dict.fromkeys(STATES, 0.0)
+        self._since = time.monotonic()
+        self._sampler = None
+        self._base_interval = None
+        self._saver = None
+        self._deferred = {}
+        self._idle_timer = None
+        self._pending = None
+
+    def start(self, qtile, sampler):
+        if self._sampler is not sampler:
+            # Follow whichever sampler config.py passes in
+            if self._sampler is not None:
+                self._sampler.unsubscribe(self._on_sample)
+            self._sampler = sampler
+            self._base_interval = sampler.interval
+            sampler.subscribe(self._on_sample)
+        if self._saver is None and qtile.core.name == "x11":
+            try:
+                self._saver = _ScreenSaver(lambda: self.changed(qtile))
+            except Exception:
+                logger.exception("throttle: no X screensaver extension, idle is not detected")
+        self.changed(qtile)
+
+    def changed(self, qtile, *_):
+        """Something that affects whether the bar is seen changed."""
+        if self._pending is None:
+            self._pending = qtile.call_soon(self.evaluate, qtile)
+
+    def suspend(self, qtile):
+        self.suspended = True
+        self.evaluate(qtile)
+
+    def resume(self, qtile):
+        self.suspended = False
+        self.evaluate(qtile)
+
+    def _on_sample(self, snapshot):
+        # Returning from idle is noticed on the slow ticks
+        if self.state == "idle":
+            self.evaluate(qtile)
+
+    def evaluate(self, qtile):
+        self._pending = None
+        saver_on, idle_for = False, 0.0
+        if self._saver is not None:
+            try:
+                saver_on, idle_for = self._saver.query()
+            except Exception:
+                logger.exception("throttle: screensaver query failed")
+        if self.suspended:
+            state, reason = "hidden", "suspended"
+        elif saver_on:
+            state, reason = "hidden", "screensaver"
+        elif bars_covered(qtile):
+            state, reason = "hidden", "fullscreen"
+        elif idle_for >= self.idle_after:
+            state, reason = "idle", f"no input for {idle_for:.0f}s"
+        else:
+            state, reason = "visible", "in use"
+        self._schedule_idle(qtile, state, idle_for)
+        if state != self.state:
+            self._enter(state, reason)
+
+    def _schedule_idle(self, qtile, state, idle_for):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        if state == "visible" and self._saver is not None:
+            self._idle_timer = qtile.call_later(self.idle_after - idle_for, self.evaluate, qtile)
+
+    def _enter(self, state, reason):
+        now = time.monotonic()
+        spent = now - self._since
+        self.time_in[self.state] += spent
+        if self._sampler is not None:
+            self.avoided["sampler"] += spent / self._base_interval - spent / self._sampler_interval(self.state)
+        self._since = now
+        logger.debug("throttle: %s -> %s (%s)", self.state, state, reason)
+        self.state, self.reason = state, reason
+        if self._sampler is not None:
+            if state == "hidden":
+                self._sampler.pause()
+            else:
+                self._sampler.interval = self._sampler_interval(state)
+                self._sampler.resume()
+        if state != "hidden":
+            self._flush()
+
+    def _sampler_interval(self, state):
+        if state == "hidden":
+            return float("inf")
+        return self.idle_interval if state == "idle" else self._base_interval
+
+    @property
+    def hidden(self):
+        return self.state == "hidden"
+
+    def defer(self, name, callback, interval=None):
+        """Hold callback until the bar is visible again.
+
+        Returns False, and holds nothing, while the bar is visible. interval
+        is how often callback would otherwise run, for counting avoided
+        wakeups. Without it every call past the first counts as one.
+        """
+        if not self.hidden:
+            return False
+        if callback in self._deferred:
+            self.avoided[name] += 1
+        else:
+            self._deferred[callback] = (name, time.monotonic(), interval)
+        return True
+
+    def _flush(self):
+        deferred, self._deferred = self._deferred, {}
+        now = time.monotonic()
+        for callback, (name, since, interval) in deferred.items():
+            if interval:
+                self.avoided[name] += int((now - since) / interval)
+            try:
+                callback()
+            except Exception:
+                logger.exception("throttle: deferred %s failed", name)
+
+    def report(self):
+        time_in = dict(self.time_in)
+        time_in[self.state] += time.monotonic() - self._since
+        lines = [f"{self.state} ({self.reason}), {sum(self.avoided.values()):.0f} wakeups avoided"]
+        lines.extend(f"  {name:9} {seconds / 60:7.1f} min" for name, seconds in time_in.items())
+        lines.extend(f"  {name:9} {count:7.0f} avoided" for name, count in self.avoided.most_common())
+        text = "\n".join(lines)
+        logger.info("throttle:\n%s", text)
+        return text
+
+
+class Clock(clock.Clock):
+    """widget.Clock that stops ticking while THROTTLE has the bar hidden."""
+
+    def timer_setup(self):
+        if THROTTLE.defer("clock", self.timer_setup, self.update_interval):
+            return
+        clock.Clock.timer_setup(self)
+
+
+# Keep the counters and the screensaver connection when reload_config
+# re-runs this module
+if "THROTTLE" not in globals():
+    THROTTLE = Throttle()
@@ -0,0 +1,167 @@
+"""Volume widget driven by PulseAudio/PipeWire events.
+
+widget.Volume polls amixer on a timer. This one subscribes to sink and
+server change events through pulsectl-asyncio on qtile's own event loop and
+redraws only when something changed, so it has no wakeups while the volume
+sits still. Bursts of events (dragging a slider in pavucontrol) are
+collapsed into one redraw by a short debounce. While throttle.py has the
+bar hidden, redraws wait until it shows again.
+
+The sound server is reached through a source object with ``state()``,
+``events()``, ``change_volume()`` and ``toggle_mute()`` coroutines, so a
+fake source can stand in for it.
+"""
+import asyncio
+
+from libqtile.log_utils import logger
+from libqtile.widget import base
+
+import throttle
+
+
+class PulseSource:
+    def __init__(self, client_name="qtile-volume"):
+        self.client_name = client_name
+        self.pulse = None
+
+    async def connect(self):
+        import pulsectl_asyncio
+
+        self.pulse = pulsectl_asyncio.PulseAsync(self.client_name)
+        await self.pulse.connect()
+
+    def close(self):
+        if self.pulse is not None:
+            self.pulse.close()
+            self.pulse = None
+
+    async def _sink(self):
+        server = await self.pulse.server_info()
+        return await self.pulse.get_sink_by_name(server.default_sink_name)
+
+    async def state(self):
+        sink = await self._sink()
+        return round(sink.volume.value_flat * 100), bool(sink.mute)
+
+    async def events(self):
+        async for event in self.pulse.subscribe_events("sink", "server"):
+            yield event
+
+    async def change_volume(self, step):
+        sink = await self._sink()
+        await self.pulse.volume_change_all_chans(sink, step / 100)
+
+    async def toggle_mute(self):
+        sink = await self._sink()
+        await self.pulse.mute(sink, not sink.mute)
+
+
+class Volume(base._TextBox):
+    defaults = [
+        ("step", 2, "Volume change in percent per scroll step"),
+        ("debounce", 0.03, "Seconds to wait for more events before redrawing"),
+        ("source", None, "Sound server source, None for PulseSource()"),
+        ("mute_format", "M", "Text shown while the sink is muted"),
+        ("volume_app", "pavucontrol", "App to open on right click"),
+    ]
+
+    def __init__(self, **config):
+        base._TextBox.__init__(self, "", **config)
+        self.add_defaults(Volume.defaults)
+        self.add_callbacks({
+            "Button1": self.toggle_mute,
+            "Button3": self.run_app,
+            "Button4": self.increase_vol,
+            "Button5": self.decrease_vol,
+        })
+        self.redraws = 0
+        self.events_seen = 0
+        self.connected = False
+        self._task = None
+        self._pending = None
+
+    def _configure(self, qtile, bar):
+        base._TextBox._configure(self, qtile, bar)
+        if self.source is None:
+            self.source = PulseSource()
+        # Screen changes configure the widget again, keep one listener
+        if not self.configured:
+            self._task = asyncio.get_event_loop().create_task(self._listen())
+
+    def finalize(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._pending is not None:
+            self._pending.cancel()
+        if hasattr(self.source, "close"):
+            self.source.close()
+        base._TextBox.finalize(self)
+
+    async def _listen(self):
+        delay = 1
+        while True:
+            try:
+                if hasattr(self.source, "connect"):
+                    await self.source.connect()
+                self.connected = True
+                await self._refresh()
+                delay = 1
+                async for _ in self.source.events():
+                    self.events_seen += 1
+                    self._schedule_refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("volume: lost the sound server, retrying in %ss", delay)
+            self.connected = False
+            if hasattr(self.source, "close"):
+                self.source.close()
+            # Only reached when the server went away: back off, don't poll
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def _schedule_refresh(self):
+        if throttle.THROTTLE.defer("volume", self._schedule_refresh):
+            return
+        if self._pending is not None:
+            self._pending.cancel()
+        loop = asyncio.get_event_loop()
+        self._pending = loop.call_later(self.debounce, lambda: self._run(self._refresh()))
+
+    async def _refresh(self):
+        self._pending = None
+        volume, muted = await self.source.state()
+        text = self.mute_format if muted else f"{volume}%"
+        if text != self.text:
+            self.redraws += 1
+            self.update(text)
+
+    def _run(self, coro):
+        task = asyncio.get_event_loop().create_task(coro)
+        task.add_done_callback(self._done)
+        return task
+
+    @staticmethod
+    def _done(task):
+        # Log here, nothing else awaits these tasks
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("volume: %s failed", task.get_coro().__qualname__, exc_info=task.exception())
+
+    def _command(self, method, *args):
+        # Scrolling or clicking while the sound server is away does nothing,
+        # _listen is already reconnecting
+        if self.connected:
+            self._run(method(*args))
+
+    def increase_vol(self):
+        self._command(self.source.change_volume, self.step)
+
+    def decrease_vol(self):
+        self._command(self.source.change_volume, -self.step)
+
+    def toggle_mute(self):
+        self._command(self.source.toggle_mute)
+
+    def run_app(self):
+        if self.volume_app:
+            self.qtile.spawn(self.volume_app)
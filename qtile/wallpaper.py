@@ -0,0 +1,214 @@
+"""Wallpaper rotation with a per-screen cache of pre-scaled images.
+
+Replaces variety. Each image is scaled and cropped once to fill a screen's
+exact geometry and cached as a PNG in ~/.cache/qtile/wallpapers. The file
+name is the source's content hash plus the geometry.
+
+Decoding and scaling run in one worker thread. The worker also decodes the
+cached PNG, so on X11 the event loop only copies the ready image surface
+into the root pixmap. Wayland has no such hook and goes through
+screen.paint(), which decodes the cached PNG on the loop but still does no
+scaling. Right after a switch the images for the next switch are rendered
+too, so a scheduled switch is normally a cache hit. Every screen shows a
+different image from the same shuffled order. The least recently used cache
+entries are removed once the cache grows past cache_limit bytes.
+"""
+import hashlib
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cairocffi
+import cairocffi.pixbuf
+from libqtile import qtile
+from libqtile.log_utils import logger
+
+CACHE_HOME = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+DEFAULT_CACHE = os.path.join(CACHE_HOME, "qtile", "wallpapers")
+EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def render(src, dest, width, height):
+    """Scale and centre-crop src to fill width x height, like qtile's "fill" mode.
+
+    Writes the result to dest and returns it as an image surface.
+    """
+    with open(src, "rb") as f:
+        image, _ = cairocffi.pixbuf.decode_to_image_surface(f.read())
+    scale = max(width / image.get_width(), height / image.get_height())
+    out = cairocffi.ImageSurface(cairocffi.FORMAT_RGB24, width, height)
+    ctx = cairocffi.Context(out)
+    ctx.translate((width - image.get_width() * scale) / 2, (height - image.get_height() * scale) / 2)
+    ctx.scale(scale)
+    ctx.set_source_surface(image)
+    ctx.get_source().set_filter(cairocffi.FILTER_GOOD)
+    ctx.paint()
+    tmp = dest + ".tmp"
+    out.write_to_png(tmp)
+    os.replace(tmp, dest)
+    return out
+
+
+def load(path):
+    with open(path, "rb") as f:
+        image, _ = cairocffi.pixbuf.decode_to_image_surface(f.read())
+    return image
+
+
+def blit(screen, image):
+    """Copy an already decoded image onto the X11 root pixmap under screen."""
+    painter = qtile.core.painter
+    root_pixmap, surface = painter._get_root_pixmap_and_surface(screen)
+    with cairocffi.Context(surface) as ctx:
+        ctx.rectangle(screen.x, screen.y, screen.width, screen.height)
+        ctx.set_source_surface(image, screen.x, screen.y)
+        ctx.fill()
+    surface.finish()
+    painter._update_root_pixmap(root_pixmap)
+
+
+class WallpaperEngine:
+    def __init__(self, cache_dir=DEFAULT_CACHE, cache_limit=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.cache_limit = cache_limit
+        self.directory = None
+        self.interval = 900
+        self.order = []
+        self.position = 0
+        self.hits = 0
+        self.renders = 0
+        self._hashes = None
+        self._timer = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wallpaper")
+
+    def start(self, directory, interval=900, shuffle=True):
+        directory = os.path.expanduser(directory)
+        if directory != self.directory or not self.order:
+            self.directory = directory
+            self.order = self._images(shuffle)
+            self.position = 0
+        self.interval = interval
+        self.show()
+
+    def _images(self, shuffle):
+        try:
+            names = sorted(n for n in os.listdir(self.directory) if n.lower().endswith(EXTENSIONS))
+        except OSError as e:
+            logger.warning("wallpaper: cannot list %s: %s", self.directory, e)
+            return []
+        images = [os.path.join(self.directory, n) for n in names]
+        if shuffle:
+            random.shuffle(images)
+        return images
+
+    def _targets(self, position):
+        return [
+            (screen, self.order[(position + i) % len(self.order)], (screen.width, screen.height))
+            for i, screen in enumerate(qtile.screens)
+        ]
+
+    def show(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.order:
+            return
+        targets = self._targets(self.position)
+        # Only X11 can take a decoded surface, see blit()
+        decode = qtile.core.name == "x11"
+        future = self._executor.submit(self._prepare, [(src, size) for _, src, size in targets], decode)
+        future.add_done_callback(lambda f: qtile.call_soon_threadsafe(self._paint, targets, f))
+        upcoming = self._targets(self.position + len(targets))
+        self._executor.submit(self._prepare, [(src, size) for _, src, size in upcoming])
+        if self.interval:
+            self._timer = qtile.call_later(self.interval, self.next)
+
+    def next(self):
+        if self.order:
+            self.position = (self.position + len(qtile.screens)) % len(self.order)
+        self.show()
+
+    def _paint(self, targets, future):
+        try:
+            prepared = future.result()
+        except Exception:
+            logger.exception("wallpaper: could not prepare wallpapers")
+            return
+        start = time.perf_counter()
+        for (screen, _, _), (path, image) in zip(targets, prepared):
+            if image is not None:
+                blit(screen, image)
+            elif path is not None:
+                screen.paint(path)
+        logger.debug("wallpaper: painted %d screens in %.1fms", len(targets), (time.perf_counter() - start) * 1000)
+
+    def _prepare(self, items, decode=False):
+        """Runs in the worker thread.
+
+        Returns (cached file, image surface or None) for each (source, size).
+        The surface is only decoded when decode is set.
+        """
+        prepared = []
+        for src, (width, height) in items:
+            image = None
+            try:
+                dest = os.path.join(self.cache_dir, f"{self._digest(src)}-{width}x{height}.png")
+                if os.path.exists(dest):
+                    os.utime(dest)
+                    self.hits += 1
+                    if decode:
+                        image = load(dest)
+                else:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    image = render(src, dest, width, height)
+                    self.renders += 1
+                    self._evict()
+            except Exception:
+                logger.exception("wallpaper: could not render %s", src)
+                dest = image = None
+            prepared.append((dest, image if decode else None))
+        return prepared
+
+    def _digest(self, src):
+        index_path = os.path.join(self.cache_dir, "sources.json")
+        if self._hashes is None:
+            try:
+                with open(index_path) as f:
+                    self._hashes = json.load(f)
+            except (OSError, ValueError):
+                self._hashes = {}
+        st = os.stat(src)
+        known = self._hashes.get(src)
+        if known is not None and known[:2] == [st.st_mtime_ns, st.st_size]:
+            return known[2]
+        digest = hashlib.sha1()
+        with open(src, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        self._hashes[src] = [st.st_mtime_ns, st.st_size, digest.hexdigest()]
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(self._hashes, f)
+        os.replace(index_path + ".tmp", index_path)
+        return digest.hexdigest()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".png"):
+                path = os.path.join(self.cache_dir, name)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.cache_limit:
+                break
+            os.remove(path)
+            total -= size
+
+
+# Keep the rotation and its worker when reload_config re-runs this module
+if "ENGINE" not in globals():
+    ENGINE = WallpaperEngine()
@@ -0,0 +1,73 @@
+"""Load qtile/config.py headlessly in a loop and report how long it takes.
+
+The first load imports libqtile and qtile_extras from scratch, like qtile
+starting. Later loads re-import only the config folder's own modules, like
+reload_config does. Nothing is drawn, so this measures evaluating the config
+and building the widgets, not configuring the bar.
+
+    python scripts/bench_config.py [-n RUNS] [--config PATH]
+"""
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import tempfile
+
+
+def purge_config_modules(config_dir):
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if os.path.dirname(os.path.abspath(path)) == config_dir:
+            del sys.modules[name]
+
+
+def load_config(config_dir, name):
+    from libqtile import hook
+
+    purge_config_modules(config_dir)
+    hook.clear()
+    config = importlib.import_module(name)
+    return config.PROFILE.finish()
+
+
+def milliseconds(values):
+    return f"{statistics.median(values) * 1000:8.1f} {min(values) * 1000:8.1f} {max(values) * 1000:8.1f}"
+
+
+def main():
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Benchmark loading the qtile config.")
+    parser.add_argument("-n", "--runs", type=int, default=20, help="Number of loads (default: 20)")
+    parser.add_argument("--config", default=os.path.join(repo, "qtile", "config.py"), help="Config file to load")
+    args = parser.parse_args()
+
+    config_dir = os.path.dirname(os.path.abspath(args.config))
+    name = os.path.splitext(os.path.basename(args.config))[0]
+    sys.path.insert(0, config_dir)
+    # Keep the benchmark's loads out of the real load log
+    os.environ["XDG_STATE_HOME"] = tempfile.mkdtemp(prefix="bench-config-")
+
+    records = [load_config(config_dir, name) for _ in range(args.runs)]
+    first, reloads = records[0], records[1:]
+    print(f"first load: {first['config_s'] * 1000:.1f}ms")
+    for phase, seconds in first["phases"].items():
+        print(f"  {phase:<24}{seconds * 1000:8.1f}ms")
+    if not reloads:
+        return
+    print(f"\nreloads ({len(reloads)}): {'median':>8} {'min':>8} {'max':>8} ms")
+    print(f"  {'total':<24}{milliseconds([r['config_s'] for r in reloads])}")
+    for phase in reloads[0]["phases"]:
+        values = [r["phases"].get(phase, 0.0) for r in reloads]
+        print(f"  {phase:<24}{milliseconds(values)}")
+    print("\nper widget on reload (median ms):")
+    widgets = {}
+    for record in reloads:
+        for index, (widget, seconds) in enumerate(record["widgets"]):
+            widgets.setdefault((index, widget), []).append(seconds)
+    for (index, widget), values in sorted(widgets.items()):
+        print(f"  {index:2} {widget:<24}{statistics.median(values) * 1000:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
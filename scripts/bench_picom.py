@@ -0,0 +1,111 @@
+"""Measure picom's frame time and CPU cost for each profile in qtile/compositor.py.
+
+Each profile is rendered from picom/picom.conf with the xrender backend and
+without vsync. It runs on a private Xvfb showing a stack of overlapping
+windows. picom's --benchmark mode repaints the whole screen a given number
+of times and exits. Every profile is run at two cycle counts, and the
+difference gives the cost of one frame without picom's startup.
+
+Needs Xvfb (xorg-server-xvfb), picom and xcffib.
+
+    python scripts/bench_picom.py [--cycles N] [--windows N] [--repeat N]
+"""
+import argparse
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import xcffib
+import xcffib.xproto
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(repo, "qtile"))
+
+from compositor import ORDER, write_profiles  # noqa: E402
+
+BENCH_OVERRIDES = {"backend": '"xrender"', "vsync": "false"}
+SIZE = (1920, 1080)
+
+
+def start_xvfb():
+    read, write = os.pipe()
+    xvfb = subprocess.Popen(
+        ["Xvfb", "-displayfd", str(write), "-screen", "0", f"{SIZE[0]}x{SIZE[1]}x24", "-nolisten", "tcp"],
+        pass_fds=(write,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    os.close(write)
+    with os.fdopen(read) as f:
+        number = f.readline().strip()
+    if not number:
+        xvfb.kill()
+        sys.exit("Xvfb did not start")
+    return xvfb, f":{number}"
+
+
+def open_windows(display, count):
+    """Overlapping windows for picom to shadow, round and fade; keep the connection open."""
+    conn = xcffib.connect(display=display)
+    screen = conn.get_setup().roots[conn.pref_screen]
+    for i in range(count):
+        wid = conn.generate_id()
+        conn.core.CreateWindow(
+            screen.root_depth, wid, screen.root,
+            80 + i * 60, 60 + i * 40, 900, 600, 0,
+            xcffib.xproto.WindowClass.InputOutput, screen.root_visual,
+            xcffib.xproto.CW.BackPixel, [0x203040 + i * 0x101010],
+        )
+        conn.core.MapWindow(wid)
+    conn.flush()
+    return conn
+
+
+def run_picom(config, display, cycles):
+    """Wall and CPU seconds of one picom --benchmark run."""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    subprocess.run(
+        ["picom", "--config", config, "--benchmark", str(cycles)],
+        env={**os.environ, "DISPLAY": display},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True,
+    )
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark picom profiles under Xvfb.")
+    parser.add_argument("--cycles", type=int, default=1000, help="Frames per measured run (default: 1000)")
+    parser.add_argument("--windows", type=int, default=8, help="Windows on screen (default: 8)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per profile (default: 3)")
+    parser.add_argument("--config", default=os.path.join(repo, "picom", "picom.conf"), help="Base picom.conf")
+    args = parser.parse_args()
+
+    paths = write_profiles(args.config, tempfile.mkdtemp(prefix="bench-picom-"), BENCH_OVERRIDES)
+    xvfb, display = start_xvfb()
+    try:
+        conn = open_windows(display, args.windows)
+        print(f"{args.windows} windows at {SIZE[0]}x{SIZE[1]}, xrender, {args.cycles} frames per run")
+        print(f"{'profile':<10}{'frame ms':>10}{'cpu ms':>10}{'cpu % at 60fps':>16}")
+        for name in ORDER:
+            frames, cpus = [], []
+            for _ in range(args.repeat):
+                short_wall, short_cpu = run_picom(paths[name], display, 10)
+                wall, cpu = run_picom(paths[name], display, args.cycles + 10)
+                frames.append((wall - short_wall) / args.cycles * 1000)
+                cpus.append((cpu - short_cpu) / args.cycles * 1000)
+            frame, cpu = statistics.median(frames), statistics.median(cpus)
+            print(f"{name:<10}{frame:10.2f}{cpu:10.2f}{cpu * 60 / 10:16.1f}")
+        conn.disconnect()
+    finally:
+        xvfb.terminate()
+        xvfb.wait()
+
+
+if __name__ == "__main__":
+    main()
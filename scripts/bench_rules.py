@@ -0,0 +1,87 @@
+"""Compare qtile's linear rule matching with qtile/rules.py's RuleIndex.
+
+Builds rule sets of growing size (mostly exact wm_class and title rules,
+plus a few regex and func rules like a real config) and times deciding a
+batch of new windows both ways.
+
+    python scripts/bench_rules.py [--windows N]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "qtile"))
+
+from libqtile.config import Match  # noqa: E402
+
+from rules import RuleIndex  # noqa: E402
+
+
+class FakeWindow:
+    def __init__(self, number):
+        self.name = f"Window {number}"
+        self.wid = number
+        self._class = [f"app{number}", f"App{number}"]
+
+    def get_wm_class(self):
+        return self._class
+
+    def get_wm_type(self):
+        return "normal"
+
+    def get_wm_role(self):
+        return None
+
+    def get_pid(self):
+        return 1000
+
+    def has_fixed_size(self):
+        return False
+
+    def has_fixed_ratio(self):
+        return False
+
+    def match(self, match):
+        return match.compare(self)
+
+
+def make_rules(count):
+    matches = [
+        Match(wm_type="dialog"),
+        Match(func=lambda c: c.has_fixed_size()),
+        Match(title=re.compile(r"^Preferences")),
+    ]
+    for i in range(count - len(matches)):
+        matches.append(Match(wm_class=f"App{i}") if i % 4 else Match(title=f"Tool {i}"))
+    return matches
+
+
+def timed(decide, windows):
+    start = time.perf_counter()
+    for window in windows:
+        decide(window)
+    return (time.perf_counter() - start) / len(windows) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark window rule matching.")
+    parser.add_argument("--windows", type=int, default=2000, help="Windows decided per rule set (default: 2000)")
+    args = parser.parse_args()
+
+    print(f"{'rules':>6} {'linear us':>10} {'indexed us':>11} {'speedup':>8}")
+    for count in (10, 50, 100, 500, 1000):
+        matches = make_rules(count)
+        index = RuleIndex(matches)
+        windows = [FakeWindow(i % (count * 2)) for i in range(args.windows)]
+        for window in windows:
+            linear = any(window.match(m) for m in matches)
+            assert linear == (index.first(window) is not None)
+        linear_us = timed(lambda w: any(w.match(m) for m in matches), windows)
+        indexed_us = timed(index.first, windows)
+        print(f"{count:>6} {linear_us:>10.1f} {indexed_us:>11.1f} {linear_us / indexed_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
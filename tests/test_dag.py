@@ -0,0 +1,27 @@
+from installer.dag import Step, run_steps
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+def test_failure_skips_diamond_once():
+    # Same shape as check_packages -> copy_files -> setup_kvm_libvirt, where
+    # setup_kvm_libvirt also needs check_packages directly
+    steps = [
+        Step("a", fail),
+        Step("b", lambda: None, needs=["a"]),
+        Step("c", lambda: None, needs=["a", "b"]),
+        Step("d", lambda: None),
+    ]
+    assert run_steps(steps) == {"a": "failed", "b": "skipped", "c": "skipped", "d": "done"}
+
+
+def test_failure_skips_wide_diamond():
+    steps = [
+        Step("a", fail),
+        Step("b", lambda: None, needs=["a"]),
+        Step("c", lambda: None, needs=["a"]),
+        Step("d", lambda: None, needs=["b", "c"]),
+    ]
+    assert run_steps(steps) == {"a": "failed", "b": "skipped", "c": "skipped", "d": "skipped"}